@@ -1,8 +1,10 @@
 '''The 'API' for gradeforge, as much as python has APIs'''
 from .parse import (parse_exam, parse_sections, parse_bookstore,
-                    parse_catalog, parse_grades, parse_semester)
-from .download import get_exam, get_sections, get_bookstore, get_catalog, get_grades
-from .sql import TABLES, create, query, dump
+                    parse_catalog, parse_grades, parse_semester, parse_many)
+from .download import (get_exam, get_sections, get_sections_sharded, get_bookstore,
+                       get_catalog, get_grades)
+from .sql import TABLES, INDEXES, QUERIES, create, query, dump, explain
 from .web import app
-from .utils import allowed, get_season_today, DEFAULT_DATABASE
+from .utils import (allowed, get_season_today, get_semester_today, parse_size,
+                    DEFAULT_DATABASE, DEFAULT_CACHE)
 from .combine import combine_grades, combine_instructors, combine_departments, combine_terms
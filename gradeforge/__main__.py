@@ -2,13 +2,22 @@
 makefile; if you want to run SQL queries I recommend running `make` then
 `gradeforge sql query <your_query>`.'''
 
+from collections import Counter
 from datetime import date
+from functools import partial
 from sys import stdout
 from os import path
+from time import time
 import argparse
 import logging
+import sqlite3
 
 from . import *
+from .parse import BATCH, output_paths
+from .cache import PARSE_CACHE, HTTP_CACHE, cached_parse
+from .sql import create_indexes
+from .utils import atomic_output
+from . import cache, mirror, pipeline, replay, seats, session
 
 def main():
 
@@ -33,27 +42,42 @@ def main():
     WEB = SUBPARSERS.add_parser('web',
         description='run the web server')
     WEB.add_argument('--port', '-p', type=int, default=5000)
+    WEB.add_argument('--database', '-d', default=DEFAULT_DATABASE)
+    WEB.add_argument('--immutable', action='store_true',
+                     help='memory map the database and skip locking. '
+                     "only use this if nothing changes the database while it's served")
 
     # begin `parse` parser
     PARSE = SUBPARSERS.add_parser('parse', description='parse downloaded files')
+    PARSE.add_argument('--jobs', '-j', type=int,
+                       help='parse many files at once with a pool of JOBS processes '
+                       '(0 for one per CPU). every positional argument is an input; '
+                       'outputs are named after their input, the same way as the makefile')
+    PARSE.add_argument('--cache', action='store_true',
+                       help="copy outputs from the cache if the input's contents were parsed "
+                       'before. only works when every output is a file')
+    PARSE.add_argument('--cache-dir', default=PARSE_CACHE)
 
     # parent parser
     IO = ArgumentParser(add_help=False)
-    IO.add_argument('input', help='file to parse')
-    IO.add_argument('output', help='main output of parse function', nargs='?', default=stdout)
+    IO.add_argument('files', nargs='+', metavar='FILE',
+                    help='without --jobs: the file to parse, then optionally where to write '
+                    'the main output (default stdout). with --jobs: every file to parse')
 
     INFO = PARSE.add_subparsers(dest='info', help='type of info to parse')
     INFO.required = True
     INFO.add_parser('exam', parents=[IO])
     INFO.add_parser('bookstore', parents=[IO])
-    INFO.add_parser('grades', parents=[IO])
-    INFO.add_parser('catalog', parents=[IO]).add_argument('--departments', '--department-output',
-                                                        default=stdout)
+    INFO.add_parser('grades', parents=[IO]).add_argument(
+        '--pages', type=int, metavar='JOBS',
+        help='split up the pages of pdftotext output in this many processes (0 for one per CPU)')
+    INFO.add_parser('catalog', parents=[IO]).add_argument('--departments', '--department-output')
 
     SECTIONS = INFO.add_parser('sections', parents=[IO])
     for opt in ['instructor', 'term']:
-        SECTIONS.add_argument('--%ss' % opt, '--%s-output' % opt,
-                            default=stdout)
+        SECTIONS.add_argument('--%ss' % opt, '--%s-output' % opt)
+    SECTIONS.add_argument('--stream', action='store_true',
+                          help='read rows incrementally so memory use stays constant')
 
     # begin sql parser
     SQL = SUBPARSERS.add_parser('sql', description='create, query, and modify the sql database')
@@ -65,18 +89,85 @@ def main():
     QUERY.add_argument('sql_query', default='SELECT sql FROM sqlite_master', nargs='?',
                     help='query to run. must be valid SQLite3 syntax, '
                     + 'but ending semicolon is optional.')
+    QUERY.add_argument('--write', action='store_true',
+                       help='allow the query to change the database. by default it is read-only')
 
-    COMMAND.add_parser('create', help='create a new database')
+    CREATE = COMMAND.add_parser('create', help='create a new database')
+    BUILD = COMMAND.add_parser('build', help='create a new database straight from downloaded '
+                               'files, without writing any CSV files')
+    for opt in 'catalogs', 'sections', 'exams', 'grades':
+        BUILD.add_argument('--' + opt, nargs='+', default=(), metavar='FILE')
+    UPDATE = COMMAND.add_parser('update', help='replace one semester of an existing database')
+    UPDATE.add_argument('--semester', default=get_semester_today(), type=str,
+                        help='semester to replace, in USC format (ex: 201808). '
+                        'defaults to the current semester')
+    for opt in 'sections', 'exams', 'grades':
+        UPDATE.add_argument('--' + opt, nargs='+', metavar='FILE',
+                            help='default: the file the makefile downloads for that semester')
+    UPDATE.add_argument('--catalogs', nargs='+', default=(), metavar='FILE',
+                        help='replace every class and add any new departments')
+    for command in CREATE, BUILD:
+        command.add_argument('--bulk', action='store_true',
+                             help='load faster by skipping fsync and the on-disk journal. '
+                             'a crash will corrupt the database, so only use this on one you '
+                             'can rebuild')
     COMMAND.add_parser('dump', help='show everything in a database')
+    COMMAND.add_parser('index', help='add any missing indexes to an existing database')
+    COMMAND.add_parser('explain', help='show which indexes the queries gradeforge runs use')
+    SEATS = COMMAND.add_parser('seats', help='download how many seats are left in sections')
+    SEATS.add_argument('--semester', default=get_semester_today(),
+                       help='semester of the sections, in USC format (ex: 201808). '
+                       'defaults to the current semester')
+    SEATS.add_argument('uids', nargs='*', metavar='UID',
+                       help='CRNs of the sections to refresh. default: every one in SEMESTER')
+    SEATS.add_argument('--ttl', type=float, default=seats.TTL,
+                       help="skip sections refreshed in the last TTL seconds")
+    SEATS.add_argument('--workers', type=int, default=seats.WORKERS)
+    SEATS.add_argument('--rate', type=float, default=seats.RATE, help='pages per second')
+
+    # begin cache parser
+    CACHE = SUBPARSERS.add_parser('cache', description='inspect or prune the parse cache, '
+                                  'or with --http the download cache')
+    CACHE.add_argument('--http', action='store_true',
+                       help='use the cache of downloads instead of parse results')
+    CACHE.add_argument('--cache-dir', help='default: %s, or %s with --http'
+                       % (PARSE_CACHE, HTTP_CACHE))
+    COMMAND = CACHE.add_subparsers(dest='command', help='command to execute')
+    COMMAND.required = True
+    COMMAND.add_parser('stats', help='show how big the cache is')
+    COMMAND.add_parser('list', help='show every entry, least recently used first')
+    PRUNE = COMMAND.add_parser('prune', help='delete old entries')
+    PRUNE.add_argument('--max-size', type=parse_size,
+                       help='delete least recently used entries until the cache is this big '
+                       '(ex: 500M)')
+    PRUNE.add_argument('--max-age', type=float, help='delete entries not used in this many days')
 
     # begin combine parser
     COMBINE = SUBPARSERS.add_parser("combine", description="combine multiple CSV files")
     COMBINE.add_argument('info', choices=('grades', 'instructors', 'terms', 'departments'))
     COMBINE.add_argument('input', nargs='+')
+    COMBINE.add_argument('--section-output', default='sections.csv',
+                         help='with terms: where to write the sections, with their terms renumbered')
 
     # begin download parser
     DOWNLOAD = SUBPARSERS.add_parser('download', description='download files from sc.edu')
     DOWNLOAD.required = True
+    DOWNLOAD.add_argument('--cache', action='store_true',
+                          help='keep responses in the download cache. pages for past semesters '
+                          'are reused without asking the server; others are revalidated')
+    DOWNLOAD.add_argument('--cache-dir', default=HTTP_CACHE)
+    RECORDING = DOWNLOAD.add_mutually_exclusive_group()
+    RECORDING.add_argument('--record', metavar='DIRECTORY',
+                           help='save every request and response to DIRECTORY')
+    RECORDING.add_argument('--replay', metavar='DIRECTORY',
+                           help='answer every request from the recordings in DIRECTORY '
+                           'instead of the network')
+    DOWNLOAD.add_argument('--latency', type=float, default=0,
+                          help='with --replay, seconds to wait before each response')
+    DOWNLOAD.add_argument('--output', '-o',
+                          help='write to OUTPUT as the download arrives instead of printing it. '
+                          'OUTPUT only appears once the download is complete, '
+                          'and is compressed if it ends in .gz or .xz')
 
     DOWNLOAD.add_argument('--season', '-s', type=str.lower,
                         default=get_season_today(),
@@ -93,6 +184,9 @@ def main():
     SECTIONS.add_argument('--campus', '-c', choices=allowed['campus'] + ('%',), default='%')
     # TODO: allowed['term'] is a dumpster fire that needs to be nuked from orbit
     SECTIONS.add_argument('--term', '-T', choices=allowed['term'], default='%')
+    SECTIONS.add_argument('--shards', type=int,
+                          help='request the page in SHARDS pieces split by department, '
+                          'several at a time, and stitch them back together')
 
     BOOKSTORE = INFO.add_parser('bookstore', description='textbooks for a given section')
     BOOKSTORE.add_argument('department', choices=allowed['department'],
@@ -100,9 +194,21 @@ def main():
     BOOKSTORE.add_argument('number', choices=range(1000), type=int, metavar='CODE')
 
     BOOKSTORE.add_argument('section')
+    BOOKSTORE.add_argument('--browser', action='store_true',
+                           help='always render the page in chrome, instead of only when '
+                           'the bookstore sends javascript')
 
     INFO.add_parser('catalog', description='courses offered')
     INFO.add_parser('exam', description='final exam times')
+    ALL = INFO.add_parser('all', description='download every file the makefile uses, '
+                          'several at a time, into the same directories as the makefile. '
+                          'files that are already there are skipped. '
+                          'ignores --season and --year')
+    ALL.add_argument('--only', nargs='+', choices=('catalog', 'sections', 'exams', 'grades'),
+                     default=('catalog', 'sections', 'exams', 'grades'))
+    ALL.add_argument('--last', help='last semester to download (default: the current one)')
+    ALL.add_argument('--compress', choices=('gz', 'xz'),
+                     help='compress every file, adding .gz or .xz to its name')
     GRADES = INFO.add_parser('grades', description='grade spreads for past semester')
     GRADES.add_argument('campus', nargs='?', type=str.lower,
                         choices=('columbia', 'aiken', 'upstate'))
@@ -116,53 +222,160 @@ def main():
 
     if ARGS.subparser == 'web':
         app.config['ENV'] = ('development' if ARGS.verbose else 'production')
+        app.config['DATABASE'] = ARGS.database
+        app.config['IMMUTABLE'] = ARGS.immutable
         app.run(debug=ARGS.verbose > 0, port=ARGS.port, use_debugger=ARGS.verbose > 0)
     elif ARGS.subparser == 'sql':
         if ARGS.command == 'create':
             # TODO: add params for csv files
-            create(database=ARGS.database)
+            for step, seconds in create(database=ARGS.database, bulk=ARGS.bulk).items():
+                print('%-10s %7.2fs' % (step, seconds))
+        elif ARGS.command == 'build':
+            pipeline.build(ARGS.database, catalogs=ARGS.catalogs, sections=ARGS.sections,
+                           exams=ARGS.exams, grades=ARGS.grades, bulk=ARGS.bulk)
         elif not path.exists(ARGS.database):
             raise ValueError("database '%s' does not exist or is invalid" % ARGS.database)
+        elif ARGS.command == 'update':
+            changes = pipeline.update(ARGS.semester, ARGS.database, sections=ARGS.sections,
+                                      exams=ARGS.exams, grades=ARGS.grades,
+                                      catalogs=ARGS.catalogs)
+            for table, (deleted, inserted) in changes.items():
+                print('%-10s -%d +%d' % (table, deleted, inserted))
         if ARGS.command == 'query':
-            print(query(ARGS.sql_query, database=ARGS.database))
+            print(query(ARGS.sql_query, database=ARGS.database, write=ARGS.write))
         elif ARGS.command == 'dump':
-            print(dump())
+            print(dump(ARGS.database))
+        elif ARGS.command == 'index':
+            with sqlite3.connect(ARGS.database) as connection:
+                create_indexes(connection)
+        elif ARGS.command == 'explain':
+            for name, plan in explain(ARGS.database).items():
+                print(name)
+                print('\n'.join('    ' + step for step in plan))
+        elif ARGS.command == 'seats':
+            results = seats.refresh_seats(ARGS.semester, ARGS.uids or None, ARGS.database,
+                                          ttl=ARGS.ttl, workers=ARGS.workers, rate=ARGS.rate)
+            print(', '.join('%d %s' % (count, result) for result, count in sorted(results.items())))
     elif ARGS.subparser == 'parse':
-        if ARGS.info == 'exam':
-            parse_exam(ARGS.input, ARGS.output)
-        elif ARGS.info == 'bookstore':
-            parse_bookstore(ARGS.input, ARGS.output)
-        elif ARGS.info == 'grades':
-            parse_grades(ARGS.input, ARGS.output)
-        elif ARGS.info == 'catalog':
-            parse_catalog(ARGS.input, catalog_output=ARGS.output,
-                        department_output=ARGS.departments)
+        kwargs = {'stream': ARGS.stream} if ARGS.info == 'sections' else {}
+        if ARGS.info == 'grades' and ARGS.pages is not None:
+            kwargs['pages'] = ARGS.pages
+        cache_dir = ARGS.cache_dir if ARGS.cache else None
+        extra_outputs = [getattr(ARGS, opt) for opt in ('departments', 'instructors', 'terms')
+                         if getattr(ARGS, opt, None) is not None]
+        if ARGS.jobs is not None:
+            if extra_outputs:
+                PARSER.error('--jobs names every output after its input; '
+                             "it can't be combined with --departments, --instructors or --terms")
+            inputs = ARGS.files
+            outputs = {output for name in inputs
+                       for output in output_paths(ARGS.info, name).values()}
+            clashes = [name for name in inputs if name in outputs]
+            if clashes:
+                PARSER.error('with --jobs every file is an input, but %s would be overwritten '
+                             'by parsing another input' % ', '.join(clashes))
+            start = time()
+            for name, seconds, hit in parse_many(ARGS.info, inputs, jobs=ARGS.jobs or None,
+                                                 cache_dir=cache_dir, **kwargs):
+                print('%s: %.2fs%s' % (name, seconds, ' (cached)' if hit else ''))
+            print('parsed %d files in %.2fs' % (len(inputs), time() - start))
         else:
-            parse_sections(ARGS.input, instructor_output=ARGS.instructors,
-                        term_output=ARGS.terms,
-                        section_output=ARGS.output)
+            if len(ARGS.files) > 2:
+                PARSER.error('parsing more than one file requires --jobs')
+            source, output = (ARGS.files + [stdout])[:2]
+            if ARGS.info == 'catalog':
+                outputs = {'catalog_output': output,
+                           'department_output': ARGS.departments or stdout}
+            elif ARGS.info == 'sections':
+                outputs = {'section_output': output,
+                           'instructor_output': ARGS.instructors or stdout,
+                           'term_output': ARGS.terms or stdout}
+            else:
+                outputs = {'output': output}
+            function = BATCH[ARGS.info][0]
+            if cache_dir is not None and stdout not in outputs.values():
+                cached_parse(function, source, outputs, cache_dir=cache_dir, **kwargs)
+            else:
+                if cache_dir is not None:
+                    logging.warning("not using the cache because some outputs are stdout")
+                function(source, **outputs, **kwargs)
+    elif ARGS.subparser == 'cache':
+        if ARGS.cache_dir is None:
+            ARGS.cache_dir = HTTP_CACHE if ARGS.http else PARSE_CACHE
+        if ARGS.command == 'list':
+            for entry, size, last_used, description in cache.describe(ARGS.cache_dir):
+                print('%s %8.1f KB %6.1f days  %s' % (path.basename(entry)[:12], size / 1024,
+                                                     (time() - last_used) / 86400, description))
+        elif ARGS.command == 'stats':
+            info = cache.stats(ARGS.cache_dir)
+            print('%s: %d entries, %.1f MB' % (info['directory'], info['entries'],
+                                               info['bytes'] / 2**20))
+            if info['entries']:
+                print('least recently used %.1f days ago, most recently %.1f days ago'
+                      % ((time() - info['oldest']) / 86400, (time() - info['newest']) / 86400))
+        else:
+            if ARGS.max_size is None and ARGS.max_age is None:
+                PARSER.error('prune needs --max-size, --max-age, or both')
+            max_age = None if ARGS.max_age is None else ARGS.max_age * 86400
+            removed, freed = cache.prune(ARGS.cache_dir, ARGS.max_size, max_age)
+            print('removed %d entries, freed %.1f MB' % (removed, freed / 2**20))
     elif ARGS.subparser == 'combine':
         if ARGS.info == 'grades':
             combine_grades(ARGS.input)
         elif ARGS.info == 'instructors':
             combine_instructors(ARGS.input)
         elif ARGS.info == 'terms':
-            combine_terms(ARGS.input)
+            combine_terms(ARGS.input, section_output=ARGS.section_output)
         else:  # departments
             combine_departments(ARGS.input)
     else:  # download
-        if ARGS.info == 'exam':
-            print(get_exam(ARGS.year, ARGS.season))
-        elif ARGS.info == 'sections':
-            print(get_sections(semester=parse_semester(ARGS.season, year=ARGS.year),
-                            campus=ARGS.campus, term=ARGS.term))
-        elif ARGS.info == 'catalog':
-            print(get_catalog(semester=parse_semester(ARGS.season, year=ARGS.year)))
-        elif ARGS.info == 'bookstore':
-            print(get_bookstore(parse_semester(ARGS.season, year=ARGS.year),
-                                ARGS.department, ARGS.number, ARGS.section))
+        if ARGS.cache:
+            session.CACHE_DIR = ARGS.cache_dir
+        if ARGS.record:
+            replay.record(ARGS.record)
+        elif ARGS.replay:
+            replay.replay(ARGS.replay, ARGS.latency)
+        if ARGS.info == 'all':
+            results = Counter()
+            compression = '.' + ARGS.compress if ARGS.compress else ''
+            for job, result in mirror.download_all(mirror.jobs(ARGS.only, ARGS.last,
+                                                               compression)):
+                results['failed' if isinstance(result, Exception) else result] += 1
+            print(', '.join('%d %s' % (count, result) for result, count in sorted(results.items())))
+            if results['failed']:
+                raise SystemExit(1)
         else:
-            stdout.buffer.write(get_grades(ARGS.year, ARGS.season, ARGS.campus))
+            if ARGS.info == 'exam':
+                fetch = partial(get_exam, ARGS.year, ARGS.season)
+            elif ARGS.info == 'sections':
+                kwargs = dict(semester=parse_semester(ARGS.season, year=ARGS.year),
+                              campus=ARGS.campus, term=ARGS.term)
+                if ARGS.shards:
+                    fetch = partial(get_sections_sharded, shards=ARGS.shards, **kwargs)
+                else:
+                    fetch = partial(get_sections, **kwargs)
+            elif ARGS.info == 'catalog':
+                fetch = partial(get_catalog, semester=parse_semester(ARGS.season, year=ARGS.year))
+            elif ARGS.info == 'bookstore':
+                # sometimes rendered by a browser, so it isn't streamed
+                page = get_bookstore(parse_semester(ARGS.season, year=ARGS.year),
+                                     ARGS.department, ARGS.number, ARGS.section,
+                                     http=not ARGS.browser)
+                fetch = lambda output=None: output.write(page.encode()) if output else page
+            else:
+                fetch = partial(get_grades, ARGS.year, ARGS.season, ARGS.campus)
+
+            if ARGS.output is not None:
+                with atomic_output(ARGS.output) as output:
+                    fetch(output=output)
+            elif ARGS.info == 'sections' and ARGS.shards:
+                fetch(output=stdout.buffer)
+            else:
+                page = fetch()
+                if isinstance(page, bytes):
+                    stdout.buffer.write(page)
+                else:
+                    print(page)
 
 if __name__ == '__main__':
     main()
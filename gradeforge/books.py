@@ -0,0 +1,158 @@
+'''Download the bookstore page of every section in a semester with a pool of browsers.
+
+The bookstore sometimes only works in a browser (see `download.get_bookstore`),
+and one headless Chrome waits several seconds per section, so a semester takes
+hours serially. This keeps a few drivers busy at once from a queue of sections,
+with one rate limit shared between them. A section that fails is retried with
+exponential backoff, and every finished section is appended to a checkpoint
+file, so a run that crashes picks up where it left off.'''
+
+import os
+import queue
+import threading
+from collections import Counter
+from logging import getLogger
+from os import path
+from time import sleep
+
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+from .download import get_bookstore, get_bookstore_http, make_driver
+from .mirror import TokenBucket
+from .utils import atomic_output
+
+LOGGER = getLogger(__name__)
+
+# browsers at once; each headless Chrome takes a few hundred MB
+DRIVERS = 4
+# bookstore pages per second, between every driver
+RATE = 1
+# attempts after the first, waiting BACKOFF, 2 * BACKOFF, 4 * BACKOFF, ... seconds between
+RETRIES = 3
+BACKOFF = 2
+
+
+def book_path(directory, semester, department, code, section):
+    '''Where the makefile expects the bookstore page for a section'''
+    return path.join(directory, '%s-%s-%s-%s.html' % (semester, department, code, section))
+
+
+def read_checkpoint(file_name):
+    '''Return the set of (department, code, section) already finished in `file_name`'''
+    try:
+        with open(file_name) as readable:
+            return {tuple(line.split()) for line in readable if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+class _Worker:
+    '''INTERNAL DO NOT USE
+    one thread and the driver it owns. The driver is only made once a page needs it,
+    and replaced if it dies'''
+    def __init__(self, factory, http):
+        self.factory, self.http = factory, http
+        self.driver = None
+
+    def fetch(self, semester, section):
+        if self.http:
+            page = get_bookstore_http(semester, [section])
+            if page is not None:
+                return page
+        if self.driver is None:
+            self.driver = self.factory()
+        return get_bookstore(semester, *section, driver=self.driver, http=False)
+
+    def reset(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:  # pylint: disable=broad-except
+                LOGGER.debug("couldn't quit driver: %s", e)
+            self.driver = None
+
+
+def download_books(sections, semester, directory='books', checkpoint=None, drivers=DRIVERS,
+                   rate=RATE, retries=RETRIES, backoff=BACKOFF, driver_factory=make_driver,
+                   http=True):
+    '''Download the bookstore page of every (department, code, section) in `sections`
+    to `directory`, with at most `drivers` drivers made by `driver_factory`.
+    checkpoint: file listing the sections that are finished, including the ones that
+                have no books; default `<directory>/<semester>.done`.
+                Sections in it, or that already have a file, are skipped.
+    http: try each page without a browser first (see download.get_bookstore_http),
+          so drivers are only started if the bookstore insists on javascript.
+    Returns a Counter of 'downloaded', 'unavailable', 'skipped' and 'failed'.
+    Failed sections aren't checkpointed, so running again tries them again.'''
+    checkpoint = checkpoint or path.join(directory, '%s.done' % semester)
+    done = read_checkpoint(checkpoint)
+    results = Counter()
+    jobs = queue.Queue()
+    for section in (tuple(map(str, section)) for section in sections):
+        if section in done or path.exists(book_path(directory, semester, *section)):
+            results['skipped'] += 1
+        else:
+            jobs.put(section)
+    if jobs.empty():
+        return results
+
+    bucket, lock = TokenBucket(rate), threading.Lock()
+    os.makedirs(directory, exist_ok=True)
+    with open(checkpoint, 'a') as finished:
+        def finish(section, result):
+            with lock:
+                results[result] += 1
+                if result != 'failed':
+                    finished.write(' '.join(section) + '\n')
+                    finished.flush()
+
+        def run():
+            worker = _Worker(driver_factory, http)
+            try:
+                while True:
+                    try:
+                        section = jobs.get_nowait()
+                    except queue.Empty:
+                        return
+                    finish(section, _download_one(worker, bucket, semester, section,
+                                                  directory, retries, backoff))
+            finally:
+                worker.reset()
+
+        threads = [threading.Thread(target=run, daemon=True)
+                   for _ in range(min(drivers, jobs.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results
+
+
+def _download_one(worker, bucket, semester, section, directory, retries, backoff):
+    '''INTERNAL DO NOT USE
+    returns 'downloaded', 'unavailable', or 'failed' '''
+    name = ' '.join((semester,) + section)
+    for attempt in range(retries + 1):
+        if attempt:
+            sleep(backoff * 2 ** (attempt - 1))
+        bucket.acquire()
+        try:
+            page = worker.fetch(semester, section)
+        except ValueError as e:  # there are no books, asking again won't change that
+            LOGGER.info("%s", e)
+            return 'unavailable'
+        except NoSuchElementException as e:  # the page didn't load in time
+            error = e
+        except WebDriverException as e:  # the browser crashed
+            error = e
+            worker.reset()
+        except Exception as e:  # pylint: disable=broad-except
+            error = e
+        else:
+            with atomic_output(book_path(directory, semester, *section)) as writable:
+                writable.write(page.encode())
+            LOGGER.info("downloaded %s", name)
+            return 'downloaded'
+        LOGGER.debug("%s: attempt %d failed: %s", name, attempt + 1, error)
+    LOGGER.warning("giving up on %s after %d attempts: %s", name, retries + 1, error)
+    return 'failed'
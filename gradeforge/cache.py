@@ -0,0 +1,242 @@
+'''Content-addressed cache for parse results, and a cache for HTTP responses.
+
+Make only looks at mtimes, so `touch`ing an input or downloading a byte-identical
+copy of it reparses everything. Entries here are keyed on a hash of the input
+itself plus PARSER_VERSION, so an unchanged input is a file copy instead.
+
+Layout: <cache_dir>/<sha256>/<output keyword>, e.g.
+~/.cache/gradeforge/parse/3fa2.../section_output
+
+HTTP responses are keyed on the request instead, and stored as
+<cache_dir>/<sha256>/body and <cache_dir>/<sha256>/meta.json.
+See `cached_request`.'''
+
+import hashlib
+import json
+import os
+import shutil
+from logging import getLogger
+from os import path
+from time import time
+
+import requests
+
+from .utils import DEFAULT_CACHE
+
+LOGGER = getLogger(__name__)
+
+# bump this whenever a parse function gives different output for the same input
+PARSER_VERSION = 1
+
+PARSE_CACHE = path.join(DEFAULT_CACHE, 'parse')
+HTTP_CACHE = path.join(DEFAULT_CACHE, 'http')
+
+
+def input_key(function, file_name, version=PARSER_VERSION):
+    '''Return the cache key for parsing `file_name` with `function`'''
+    digest = hashlib.sha256(('%s %s\n' % (function.__name__, version)).encode())
+    with open(file_name, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _restore(cached, destination, link):
+    '''INTERNAL DO NOT USE'''
+    if link:
+        try:
+            if path.lexists(destination):
+                os.unlink(destination)
+            os.link(cached, destination)
+            return
+        except OSError as e:  # different filesystem, etc.
+            LOGGER.debug("couldn't link %s to %s, copying instead: %s", cached, destination, e)
+    shutil.copyfile(cached, destination)
+
+
+def cached_parse(function, file_name, outputs, cache_dir=PARSE_CACHE, link=False, **kwargs):
+    '''Call `function(file_name, **outputs, **kwargs)`, unless the same input has
+    been parsed by the same version of `function` before, in which case the
+    previous outputs are copied to the paths in `outputs` instead.
+
+    outputs: {keyword argument of `function`: path to write to}.
+             Every output must be a path; file handles can't be cached.
+    link: hardlink outputs to the cache instead of copying them. Only safe if
+          nothing edits the outputs in place afterwards.
+    kwargs: must not change the output (e.g. `stream`), they aren't part of the key.
+
+    Returns True if the outputs came from the cache.'''
+    entry = path.join(cache_dir, input_key(function, file_name))
+    if all(path.exists(path.join(entry, keyword)) for keyword in outputs):
+        for keyword, destination in outputs.items():
+            _restore(path.join(entry, keyword), destination, link)
+        os.utime(entry)  # keeps track of when an entry was last used, for `prune`
+        LOGGER.info("%s: using cached %s", file_name, entry)
+        return True
+
+    function(file_name, **outputs, **kwargs)
+
+    # build the entry to the side then rename, so readers never see half an entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = '%s.%d.tmp' % (entry, os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+    for keyword, written in outputs.items():
+        shutil.copyfile(written, path.join(tmp, keyword))
+    try:
+        if path.isdir(entry):  # stale or incomplete entry for the same key
+            shutil.rmtree(entry)
+        os.rename(tmp, entry)
+    except OSError:  # another process got there first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return False
+
+
+def _store(entry, files):
+    '''INTERNAL DO NOT USE
+    atomically replace `entry` with a directory containing {name: bytes} `files`'''
+    os.makedirs(path.dirname(entry), exist_ok=True)
+    tmp = '%s.%d.tmp' % (entry, os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+    for name, contents in files.items():
+        with open(path.join(tmp, name), 'wb') as handle:
+            handle.write(contents)
+    try:
+        if path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(tmp, entry)
+    except OSError:  # another process got there first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def request_key(method, url, data=None):
+    '''Return the cache key for a request. Headers aren't part of it.'''
+    request = json.dumps([method.upper(), url, data], sort_keys=True, default=str)
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+def _read_meta(entry):
+    '''INTERNAL DO NOT USE'''
+    try:
+        with open(path.join(entry, 'meta.json')) as handle:
+            meta = json.load(handle)
+        if path.exists(path.join(entry, 'body')):
+            return meta
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _cached_response(entry, meta):
+    '''INTERNAL DO NOT USE
+    rebuild the response stored in `entry`, so callers can't tell it from a real one'''
+    os.utime(entry)  # for `prune`
+    response = requests.Response()
+    with open(path.join(entry, 'body'), 'rb') as handle:
+        response._content = handle.read()  # pylint: disable=protected-access
+    # there's no connection to read from, so iter_content has to use _content,
+    # the same as a real response whose body was already read
+    response._content_consumed = True  # pylint: disable=protected-access
+    response.raw = None
+    response.status_code = 200
+    response.url = meta['url']
+    response.encoding = meta['encoding']
+    response.headers.update(meta['headers'])
+    return response
+
+
+def cached_request(session, method, url, cache_dir=HTTP_CACHE, immutable=False, **kwargs):
+    '''Like `session.request(method, url, **kwargs)`, but successful responses are
+    kept in `cache_dir` and reused:
+
+    - if the cached response was marked `immutable`, it's returned without any network I/O.
+    - otherwise the request is sent with If-None-Match/If-Modified-Since from the
+      cached response, and a 304 Not Modified returns the cached body.
+
+    immutable: mark the response as never changing, for example a past semester.
+    Returns a requests.Response.'''
+    entry = path.join(cache_dir, request_key(method, url, kwargs.get('data')))
+    meta = _read_meta(entry)
+    if meta is not None and meta['immutable']:
+        LOGGER.debug("%s: using cached %s", url, entry)
+        return _cached_response(entry, meta)
+
+    headers = dict(kwargs.pop('headers', None) or {})
+    if meta is not None:
+        if meta['headers'].get('ETag'):
+            headers['If-None-Match'] = meta['headers']['ETag']
+        if meta['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+    response = session.request(method, url, headers=headers, **kwargs)
+
+    if response.status_code == 304 and meta is not None:
+        LOGGER.debug("%s: not modified, using cached %s", url, entry)
+        if immutable:
+            meta['immutable'] = True
+            with open(path.join(entry, 'meta.json'), 'w') as handle:
+                json.dump(meta, handle)
+        return _cached_response(entry, meta)
+    if response.status_code == 200:
+        kept = {key: response.headers[key] for key in ('ETag', 'Last-Modified', 'Content-Type')
+                if key in response.headers}
+        meta = {'url': url, 'method': method.upper(), 'immutable': immutable,
+                'encoding': response.encoding, 'headers': kept, 'fetched': time()}
+        _store(entry, {'body': response.content, 'meta.json': json.dumps(meta).encode()})
+    return response
+
+
+def _entries(cache_dir):
+    '''INTERNAL DO NOT USE
+    yields (path, size in bytes, last used) for every entry in `cache_dir`'''
+    if not path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        entry = path.join(cache_dir, name)
+        if name.endswith('.tmp') or not path.isdir(entry):
+            continue
+        size = sum(path.getsize(path.join(entry, f)) for f in os.listdir(entry))
+        yield entry, size, path.getmtime(entry)
+
+
+def describe(cache_dir=PARSE_CACHE):
+    '''Yield (path, size in bytes, last used, description) for every entry in
+    `cache_dir`, least recently used first. The description is the URL of an
+    HTTP response, or the outputs kept for a parse result.'''
+    for entry, size, last_used in sorted(_entries(cache_dir), key=lambda entry: entry[2]):
+        meta = _read_meta(entry)
+        if meta is not None:
+            description = '%s %s%s' % (meta['method'], meta['url'],
+                                       ' (immutable)' if meta['immutable'] else '')
+        else:
+            description = ', '.join(sorted(os.listdir(entry)))
+        yield entry, size, last_used, description
+
+
+def stats(cache_dir=PARSE_CACHE):
+    '''Return a dict describing the cache: number of entries, total bytes,
+    and when the least and most recently used entries were last used'''
+    entries = list(_entries(cache_dir))
+    used = [last_used for _, _, last_used in entries]
+    return {'directory': cache_dir,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'oldest': min(used, default=None),
+            'newest': max(used, default=None)}
+
+
+def prune(cache_dir=PARSE_CACHE, max_bytes=None, max_age=None):
+    '''Delete entries not used in the last `max_age` seconds, then delete the
+    least recently used entries until the cache is at most `max_bytes`.
+    Returns (entries removed, bytes freed).'''
+    entries = sorted(_entries(cache_dir), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    removed = freed = 0
+    now = time()
+    for entry, size, last_used in entries:
+        if not ((max_age is not None and now - last_used > max_age)
+                or (max_bytes is not None and total > max_bytes)):
+            continue
+        shutil.rmtree(entry)
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
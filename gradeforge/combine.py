@@ -2,9 +2,13 @@
 combine them into a single enormous file as befits the category.'''
 
 import csv
+from logging import getLogger
 from sys import stdout
 
-import pandas
+from .parse import Term, TermTable, is_xlsx, iter_grades
+
+LOGGER = getLogger(__name__)
+
 
 def ensure_open(file_handle, read=True):
     '''given either a path or a file descriptor, return a file descriptor'''
@@ -14,16 +18,22 @@ def ensure_open(file_handle, read=True):
     return open(file_handle, mode[0])
 
 
+GRADE_HEADERS = ('SEMESTER,CAMPUS,DEPARTMENT,CODE,SECTION,TITLE,A,B+,B,C+,C,D+,D,F,'
+                 'A_GF,B+_GF,B_GF,C_GF,C+_GF,D+_GF,D_GF,F_GF,'
+                 'S,U,UN,INCOMPLETE,W,WF,NR,TOTAL,No Grade,T,IP,FN,AUDIT').split(',')
+
+
 def combine_grades(file_handles, output=stdout):
     '''The headers for CSV files change from file to file.
-    This method normalizes headers and adds empty strings if needed.'''
-    headers = ('SEMESTER,CAMPUS,DEPARTMENT,CODE,SECTION,TITLE,A,B+,B,C+,C,D+,D,F,'
-               'A_GF,B+_GF,B_GF,C_GF,C+_GF,D+_GF,D_GF,F_GF,'
-               'S,U,UN,INCOMPLETE,W,WF,NR,TOTAL,No Grade,T,IP,FN,AUDIT')
+    This method normalizes headers and adds empty strings if needed.
+    xlsx grade spreads are read directly, without converting them to CSV first.'''
     output = ensure_open(output, read=False)
-    writer = csv.DictWriter(output, headers.split(','))
+    writer = csv.DictWriter(output, GRADE_HEADERS)
     writer.writeheader()
     for handle in file_handles:
+        if is_xlsx(handle):
+            writer.writerows(iter_grades(handle))
+            continue
         handle = ensure_open(handle)
         writer.writerows(csv.DictReader(handle))
         handle.close()
@@ -31,42 +41,85 @@ def combine_grades(file_handles, output=stdout):
 
 
 def simple_combine(files, output=stdout, unique=False):
-    '''Given some CSV files, slap them together.
+    '''Given some CSV files, slap them together, one row at a time.
     We don't use `cut` because it can't catch duplicates.
-    unique: columns to drop if duplicated; if falsy, don't drop anything'''
-    result = pandas.concat(map(pandas.read_csv, files), axis=0, ignore_index=True)
-    if unique:
-        result = result.drop_duplicates(unique)
-    result.to_csv(output, index=False)
+    Columns are matched by name, in the order of the first file.
+    unique: column to keep only the first row for each value of; if falsy, keep every row.
+            A later row for the same value with anything else different is dropped
+            with a warning, rather than silently.
+    Returns [(value of `unique`, row kept, row dropped)] for every conflict.'''
+    if not hasattr(output, 'write'):
+        with open(output, 'w') as writable:
+            return simple_combine(files, writable, unique)
+
+    writer = None
+    # value of `unique` -> the row kept for it. these tables are tiny,
+    # so this is much smaller than the inputs, which are never all in memory at once
+    seen, conflicts = {}, []
+    for file_name in files:
+        with ensure_open(file_name) as readable:
+            reader = csv.DictReader(readable)
+            if writer is None:
+                writer = csv.DictWriter(output, reader.fieldnames)
+                writer.writeheader()
+            for row in reader:
+                if unique:
+                    key = row[unique]
+                    kept = seen.setdefault(key, row)
+                    if kept is not row:
+                        if kept != row:
+                            LOGGER.warning("%s: %s %r is %s, keeping the first one seen: %s",
+                                           getattr(readable, 'name', file_name), unique, key,
+                                           dict(row), dict(kept))
+                            conflicts.append((key, kept, row))
+                        continue
+                writer.writerow(row)
+    return conflicts
 
 
 def combine_departments(files, output=stdout):
     '''just a little wrapper'''
-    simple_combine(files, output, unique='code')
+    return simple_combine(files, output, unique='code')
 
 
 def combine_instructors(files, output=stdout):
     '''just a little wrapper'''
-    simple_combine(files, output, unique='name')
-
-
-def combine_terms(file_handles, output=stdout):
-    '''This needs to be stateful so that terms with the same key still match
-    the correct sections. As a result, it's pretty slow. Context: terms have no
-    primary key, we used their index when parsing. If we didn't change it now,
-    we'd have the same key point to multiple different terms.'''
-    base = pandas.read_csv(file_handles[0])
-    i = len(base)
-    for handle in file_handles[1:]:
-        current = pandas.read_csv(handle)
-        base = pandas.concat((base, current), axis=0, ignore_index=True)
-        name = handle.name if hasattr('read', handle) else handle
-        section_handle = name.replace('.terms', '')
-        sections = pandas.read_csv(section_handle)
-        # broadcast operation, done to every value in the column 'term'
-        # https://docs.scipy.org/doc/numpy/user/basics.broadcasting.html
-        sections['term'] += i
-        # write it straight back to disk
-        sections.to_csv(section_handle, index=False)
-        i += len(current)
-    base.to_csv(output, index_label='id')
+    return simple_combine(files, output, unique='name')
+
+
+def combine_terms(file_handles, output=stdout, section_output='sections.csv'):
+    '''Combine the terms files written by parse_sections, and the sections files
+    next to them (the same name without `.terms`), in one pass.
+    Each file numbers its terms from 0, so every term is given a new id shared by all
+    the files, with identical terms in different files getting the same id.
+    The sections are copied to `section_output` as they're read, with `term` changed
+    to the new id. Nothing is written back to the inputs.'''
+    if not hasattr(output, 'write'):
+        with open(output, 'w') as writable:
+            combine_terms(file_handles, writable, section_output)
+            return
+
+    if not hasattr(section_output, 'write'):
+        with open(section_output, 'w') as writable:
+            combine_terms(file_handles, output, writable)
+            return
+
+    terms = TermTable()
+    sections_writer = None
+    for handle in file_handles:
+        name = handle.name if hasattr(handle, 'read') else handle
+        with ensure_open(handle) as readable:
+            # id in this file -> shared id
+            ids = [terms.intern(Term(**row)) for row in csv.DictReader(readable)]
+        with open(name.replace('.terms', '')) as sections:
+            reader = csv.DictReader(sections)
+            if sections_writer is None:
+                sections_writer = csv.DictWriter(section_output, reader.fieldnames)
+                sections_writer.writeheader()
+            for row in reader:
+                row['term'] = ids[int(row['term'])]
+                sections_writer.writerow(row)
+
+    writer = csv.writer(output)
+    writer.writerow(('id',) + Term._fields)
+    writer.writerows((i,) + term for i, term in terms.items())
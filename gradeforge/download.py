@@ -2,24 +2,57 @@
 
 '''Network-based querires; GETs and POSTs'''
 
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from os.path import exists
-from os import unlink
+from os.path import join
 from logging import getLogger
+from tempfile import TemporaryDirectory
+from xml.sax.saxutils import quoteattr
 
-from requests import get, post
 from selenium.common.exceptions import NoSuchElementException
 
-from gradeforge.utils import allowed, parse_semester, get_season, b_and_n_semester, DEFAULT_DATABASE
+from gradeforge.session import request
+from gradeforge.utils import (allowed, parse_semester, get_season, get_semester_today,
+                              b_and_n_semester, DEFAULT_DATABASE)
 
 LOGGER = getLogger(__name__)
 
-def get_sections(department='%', semester='201808', campus='%', number='', title='',
-                 min_credits=0, max_credits='', level='%', term='%', times='%',
-                 location='%', start_hour=0, start_minute=0, end_hour=0,
-                 end_minute=0, days='dummy'):
-    '''str -> str (HTML)
-    Return the unparsed webpage corresponding to the courses selected'''
+SECTIONS_URL = 'https://ssb.onecarolina.sc.edu/BANP/bwckschd.p_get_crse_unsec'
+# requests get_sections_sharded sends at once
+SHARD_WORKERS = 4
+# bytes read from the network at a time when streaming to a file
+CHUNK_SIZE = 64 * 1024
+BOOKSTORE_URL = 'https://secure.bncollege.com/webapp/wcs/stores/servlet/TBListView'
+BOOKSTORE_ID = '10052'
+
+
+def _past(semester):
+    '''INTERNAL DO NOT USE
+    pages for semesters that are over never change, so they can be cached forever'''
+    return str(semester) < get_semester_today()
+
+
+def _request(method, url, output=None, binary=False, **kwargs):
+    '''INTERNAL DO NOT USE
+    Return the body of the response, as bytes if `binary` and str otherwise.
+    If `output` (a binary file) is given, the body is written to it as it arrives
+    instead, and an error status raises requests.HTTPError'''
+    if output is None:
+        response = request(method, url, **kwargs)
+        return response.content if binary else response.text
+    response = request(method, url, stream=True, **kwargs)
+    response.raise_for_status()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        output.write(chunk)
+    return None
+
+
+def sections_form(department='%', semester='201808', campus='%', number='', title='',
+                  min_credits=0, max_credits='', level='%', term='%', times='%',
+                  location='%', start_hour=0, start_minute=0, end_hour=0,
+                  end_minute=0, days='dummy'):
+    '''Return the POST data for the sections page corresponding to the courses selected'''
     # TODO: term is a nightmare, replace it with [first_half, second_half, all]
     if department == '%':  # all sections
         department = allowed['department']
@@ -28,14 +61,16 @@ def get_sections(department='%', semester='201808', campus='%', number='', title
         campus = allowed['campus']
 
     params = locals()
-    coursesite = 'https://ssb.onecarolina.sc.edu/BANP/bwckschd.p_get_crse_unsec'
 
     for p in params:
         # if p not in allowed, assume arbitrary input acceptable
-        # TODO: allow partial subsets
-        if (params[p] != 'dummy' and p in allowed and params[p] not in allowed[p]
-                and params[p] != allowed[p]):
-            raise ValueError("%s '%s' not in %s" % (p, params[p], allowed[p]))
+        if params[p] == 'dummy' or p not in allowed or params[p] == allowed[p]:
+            continue
+        # a tuple asks for several at once, e.g. a shard of departments
+        values = params[p] if isinstance(params[p], (tuple, list)) else (params[p],)
+        for value in values:
+            if value not in allowed[p]:
+                raise ValueError("%s '%s' not in %s" % (p, value, allowed[p]))
 
     ampm = (divmod(start_hour, 12), divmod(end_hour, 12))
     data = {"BEGIN_AP": ('p' if ampm[0][0] else 'a'),
@@ -57,8 +92,91 @@ def get_sections(department='%', semester='201808', campus='%', number='', title
             "SEL_SUBJ": ('dummy', department),
             "SEL_TITLE": title,
             "TERM_IN": ('dummy', semester)}
+    return data
+
+
+def get_sections(output=None, **kwargs):
+    '''str -> str (HTML)
+    Return the unparsed webpage corresponding to the courses selected,
+    or write it to `output`; takes the same arguments as sections_form'''
+    data = sections_form(**kwargs)
+    return _request('POST', SECTIONS_URL, output, data=data,
+                    immutable=_past(data['TERM_IN'][1]))
+
+
+def department_shards(departments, shards):
+    '''Split `departments` into at most `shards` groups of about the same size, in order'''
+    size = -(-len(departments) // shards)  # round up
+    return [tuple(departments[i:i + size]) for i in range(0, len(departments), size)]
+
+
+_SECTION_START = re.compile(rb'<tr[^>]*>\s*<th[^>]*class="ddtitle"', re.IGNORECASE)
+_TABLE_TAG = re.compile(rb'<(/?)table\b', re.IGNORECASE)
+
+
+def _split_sections(page):
+    '''INTERNAL DO NOT USE
+    Return the index of the first section in `page` (bytes) and the index where the
+    table of sections is closed, or None if there are no sections'''
+    first = _SECTION_START.search(page)
+    if first is None:
+        return None
+    depth = 1  # inside the table of sections; each section has tables of its own
+    for tag in _TABLE_TAG.finditer(page, first.start()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return first.start(), tag.start()
+    raise ValueError('table of sections is never closed')
 
-    return post(coursesite, data=data).text
+
+def merge_sections(parts, output):
+    '''Write the sections pages in `parts` (file names) to `output` (a binary file)
+    as one page, with the sections in the same order. The header and footer are taken
+    from the first page which has any sections.
+    Only one part is read into memory at a time.'''
+    footer = None
+    for part in parts:
+        with open(part, 'rb') as handle:
+            page = handle.read()
+        bounds = _split_sections(page)
+        if bounds is None:  # 'No classes were found that meet your search criteria'
+            continue
+        start, end = bounds
+        if footer is None:
+            output.write(page[:start])
+            footer = page[end:]
+        output.write(page[start:end])
+    if footer is None:  # nothing in any of them, so it doesn't matter which is used
+        with open(parts[0], 'rb') as handle:
+            output.write(handle.read())
+    else:
+        output.write(footer)
+
+
+def _download_shard(data, file_name):
+    '''INTERNAL DO NOT USE'''
+    with open(file_name, 'wb') as handle:
+        _request('POST', SECTIONS_URL, handle, data=data, immutable=_past(data['TERM_IN'][1]))
+
+
+def get_sections_sharded(output, shards=8, workers=SHARD_WORKERS, **kwargs):
+    '''Write the same page as get_sections(**kwargs) to `output` (a binary file),
+    but request it in `shards` pieces split by department, `workers` at a time.
+    The server renders several small pages much faster than one enormous one,
+    and each piece is streamed to a temporary file instead of being held in memory.'''
+    departments = kwargs.pop('department', '%')
+    if departments == '%':
+        departments = allowed['department']
+    elif isinstance(departments, str):
+        departments = (departments,)
+    forms = [sections_form(department=shard, **kwargs)
+             for shard in department_shards(departments, shards)]
+    with TemporaryDirectory(prefix='gradeforge-sections-') as directory:
+        parts = [join(directory, '%d.html' % i) for i in range(len(forms))]
+        with ThreadPoolExecutor(workers) as pool:
+            # list() so the first exception is raised here
+            list(pool.map(_download_shard, forms, parts))
+        merge_sections(parts, output)
 
 
 def make_driver():
@@ -74,14 +192,48 @@ def make_driver():
     return driver
 
 
-def get_bookstore(semester, department, number, section, driver=None):
+def _bookstore_term(semester):
+    '''INTERNAL DO NOT USE'''
+    semester = str(semester)
+    return semester if len(semester) == 3 else b_and_n_semester(semester)
+
+
+def bookstore_xml(semester, courses):
+    '''Return the `courseXml` the bookstore takes, asking for every
+    (department, number, section) in `courses` at once'''
+    term = _bookstore_term(semester)
+    return '<textbookorder><courses>%s</courses></textbookorder>' % ''.join(
+        '<course dept=%s num=%s sect=%s term=%s />' % tuple(map(quoteattr, map(str, (
+            department, number, section, term))))
+        for department, number, section in courses)
+
+
+def get_bookstore_http(semester, courses):
+    '''Return the bookstore page for every (department, number, section) in `courses`,
+    with one POST and no browser. Returns None if the bookstore sent its obfuscated
+    javascript instead, in which case only get_bookstore's browser can read it.'''
+    page = _request('POST', BOOKSTORE_URL,
+                    data={'storeId': BOOKSTORE_ID, 'courseXml': bookstore_xml(semester, courses)})
+    if 'courseListForm' in page:
+        return page
+    if 'COURSE MATERIALS SELECTION PENDING' in page:
+        raise ValueError("No textbooks available for %s"
+                         % ', '.join(' '.join(map(str, course)) for course in courses))
+    LOGGER.debug("bookstore sent a challenge page for %s", courses)
+    return None
+
+
+def get_bookstore(semester, department, number, section, driver=None, http=True):
     '''The bookstore page is a hot mess of obfuscated javascript.
-    We use selenium to deobfuscate the javascript, then parse the resulting HTML'''
+    Unless `http` is False, first try asking for it without a browser (see get_bookstore_http).
+    Otherwise, we use selenium to deobfuscate the javascript, then parse the resulting HTML'''
+    if http:
+        page = get_bookstore_http(semester, [(department, number, section)])
+        if page is not None:
+            return page
     if driver is None:
         driver = make_driver()
-    semester = str(semester)
-    if len(semester) != 3:
-        semester = b_and_n_semester(semester)
+    semester = _bookstore_term(semester)
 
     xml = r'''<textbookorder><courses>\
                 <course dept=\'%s\' num=\'%s\' sect=\'%s\' term=\'%s\' />\
@@ -90,12 +242,12 @@ def get_bookstore(semester, department, number, section, driver=None):
 
     js = '''
     document.body.innerHTML += '\
-        <form id="form" action="https://secure.bncollege.com/webapp/wcs/stores/servlet/TBListView" method="post">\
-          <input name="storeId" value="10052">\
+        <form id="form" action="%s" method="post">\
+          <input name="storeId" value="%s">\
           <input name="courseXml" value="%s">\
         </form>';
     document.getElementById("form").submit();
-    ''' % xml
+    ''' % (BOOKSTORE_URL, BOOKSTORE_ID, xml)
 
     driver.execute_script(js)
     try:
@@ -103,13 +255,13 @@ def get_bookstore(semester, department, number, section, driver=None):
     except NoSuchElementException:
         if 'COURSE MATERIALS SELECTION PENDING' in driver.page_source:
             raise ValueError("No textbooks available for %s"
-                             % ' '.join([semester, department, number, section]))
+                             % ' '.join([semester, department, str(number), section]))
         raise
     return driver.page_source
 
 
-def get_catalog(department='%', semester=201808):
-    '''Return catalog courses from the given semester'''
+def get_catalog(department='%', semester=201808, output=None):
+    '''Return catalog courses from the given semester, or write them to `output`'''
     if department == '%':
         department = allowed['department']
     else:
@@ -130,20 +282,23 @@ def get_catalog(department='%', semester=201808):
             'sel_title': '',
             'sel_from_cred': '',
             'sel_to_cred': ''}
-    return post(base_url, data=data).text
+    return _request('POST', base_url, output, data=data)
 
 
-def get_exam(year, season):
+def get_exam(year, season, output=None):
     '''str -> str (HTML)
-    Return content of calendar corresponding to given semester. Example:
+    Return content of calendar corresponding to given semester, or write it to `output`. Example:
     https://www.sc.edu/about/offices_and_divisions/registrar/final_exams/final-exams-spring-2018.php'''
     if season not in ('fall', 'summer', 'spring'):
         season = get_season(parse_semester(season)).lower()
     base_url = 'https://www.sc.edu/about/offices_and_divisions/registrar/final_exams'
-    return get('%s/final-exams-%s-%s.php' % (base_url, season, year)).text
+    return _request('GET', '%s/final-exams-%s-%s.php' % (base_url, season, year), output,
+                    immutable=_past(parse_semester(season, year)))
 
 
-def get_grades(year, season, campus=None):
+def get_grades(year, season, campus=None, output=None):
+    '''Return the grade spread for the given semester as bytes (xlsx or pdf),
+    or write it to `output`'''
     campus = str(campus).lower()
     semester = parse_semester(season, year)
     base_url = 'https://www.sc.edu/about/offices_and_divisions/registrar/documents/grade_spreads'
@@ -170,26 +325,18 @@ def get_grades(year, season, campus=None):
         ext = 'pdf'
         semester += '_' + campus
     url = '%s/%s_grade_spread_report.%s' % (base_url, semester, ext)
-    return get(url).content  # NOTE: content is binary; text is encoded
+    # grade spreads are only published once the semester is over
+    return _request('GET', url, output, binary=True, immutable=True)
 
-def get_all_books(semester='201805'):
+
+def get_all_books(semester='201805', database=DEFAULT_DATABASE, **kwargs):
+    '''Download the bookstore page of every section in `semester` to books/.
+    Keyword arguments are passed to books.download_books'''
     from sqlite3 import connect
-    query = '''SELECT department, code, section
-               FROM section INNER JOIN term ON term = term.id
-               WHERE semester = ?'''
-    with connect(DEFAULT_DATABASE) as database:
-        result = database.execute(query, [semester]).fetchall()
-    driver = make_driver()
-    try:
-        for section in result:
-            output = "books/%s-%s-%s-%s.html" % (semester, *section)
-            if not exists(output):
-                with open(output, 'w') as f:
-                    try:
-                        f.write(get_bookstore(semester, *section, driver=driver))
-                        LOGGER.info("downloaded %s", f.name)
-                    except Exception as e:
-                        LOGGER.warning("Info for %s not available, deleting: %s", semester + ' '.join(section), e)
-                        unlink(output)
-    finally:
-        driver.quit()
+    from .books import download_books
+    from .sql import QUERIES
+    with connect(database) as connection:
+        sections = connection.execute(QUERIES['semester_sections'], [str(semester)]).fetchall()
+    results = download_books(sections, str(semester), **kwargs)
+    LOGGER.info("%s: %s", semester, ', '.join('%d %s' % item for item in sorted(results.items())))
+    return results
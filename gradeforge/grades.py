@@ -1,12 +1,11 @@
 '''Heavily adapted version of the original grade creator from jpc/grades.py'''
-import re
-from sqlite3 import connect
 
 # https://stackoverflow.com/questions/5503601
 import matplotlib
 matplotlib.use("Agg")
 from matplotlib import pyplot
 
+from gradeforge.sql import QUERIES, connect
 from gradeforge.utils import get_semester_today, DEFAULT_DATABASE
 
 def png_for(department, code, section, semester=get_semester_today()):
@@ -19,37 +18,18 @@ def png_for(department, code, section, semester=get_semester_today()):
     TODO: allow customization of output file'''
     department, code, section, semester = map(str, (department, code, section, semester))
 
-    metadata_query = '''
-            SELECT uid, primary_instructor, title
-            FROM section INNER JOIN class
-                            ON class.department = section.department
-                            AND class.code = section.code
-                         INNER JOIN term
-                            ON term.id = section.term
-            WHERE class.department = ?
-                  AND class.code = ?
-                  AND section = ?
-                  AND semester = ?'''
-    grades = 'A, "B+", B, "C+", C, "D+", D, F, INCOMPLETE, W, WF'
-    # NOTE: we can't use prepared statements for column names
-    grades_query = ('SELECT ' + grades
-                    + ''' FROM grade WHERE department = ?
-                                     AND code = ?
-                                     AND section = ?
-                                     AND semester = ?''')
     info = department, code, section, semester
-    with connect(DEFAULT_DATABASE) as database:
-        cursor = database.cursor()
-        try:
-            uid, instructor, title = cursor.execute(metadata_query, info).fetchone()
-            results = dict(zip(re.split('"?, "?', grades),
-                               cursor.execute(grades_query, info).fetchone()))
-        except TypeError as e:
-            raise ValueError("No sections found for " + ' '.join(info)) from e
+    cursor = connect(DEFAULT_DATABASE).cursor()
+    try:
+        uid, instructor, title = cursor.execute(QUERIES['section_info'], info).fetchone()
+        counts = cursor.execute(QUERIES['section_grades'], info).fetchone()
+        results = dict(zip((column[0] for column in cursor.description), counts))
+    except TypeError as e:
+        raise ValueError("No sections found for " + ' '.join(info)) from e
 
     if results == {}:
         quit("info for section did not match grades. query was",
-             grades_query.replace('?', str(uid)))
+             QUERIES['section_grades'].replace('?', str(uid)))
     course_code = "%s %s (S: %s)" % (department, code, section)
     header = "%s - %s - %s" % (instructor, title, course_code)
 
@@ -0,0 +1,187 @@
+'''Download everything the makefile needs, concurrently but politely.
+
+`make -j4` runs one `gradeforge download` process per file, with no limit on how
+hard it hits each server. This runs the downloads in a thread pool instead,
+with a limit on concurrent requests and a token bucket rate limit per host.
+Files are written to the same layout as the makefile, so `make` carries on from
+there. Files that are already downloaded and look complete are skipped, so an
+interrupted run can simply be started again.'''
+
+import lzma
+import threading
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import getLogger
+from os import path
+from time import monotonic, sleep
+
+from .download import get_sections, get_exam, get_grades, get_catalog
+from .utils import (atomic_output, parse_semester, get_season, get_semester_today,
+                    open_compressed, uncompressed_name)
+
+LOGGER = getLogger(__name__)
+
+SECTIONS_HOST = 'ssb.onecarolina.sc.edu'
+REGISTRAR_HOST = 'www.sc.edu'
+
+# host: (requests at once, requests per second, burst).
+# the sections server takes minutes per page and is shared by the whole university
+HOSTS = {SECTIONS_HOST: (2, 0.5, 2),
+         REGISTRAR_HOST: (4, 2, 4)}
+
+# the earliest semester of each kind that can be downloaded
+FIRST_SEMESTER = {'sections': '201341', 'exams': '201608', 'grades': '200811'}
+CAMPUSES = 'Columbia', 'Aiken', 'Upstate'
+
+# path: where to write, relative to the working directory.
+# host: key of HOSTS. fetch: function returning the file's contents as str or bytes
+Job = namedtuple('Job', ('path', 'host', 'fetch'))
+
+
+class TokenBucket:
+    '''Allows `rate` calls to `acquire` per second on average,
+    and up to `burst` at once after being idle. Thread safe.'''
+    def __init__(self, rate, burst=1):
+        self.rate, self.burst = rate, burst
+        self.tokens = burst
+        self.last = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Wait until a token is available, then take it'''
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # go into debt rather than looping, so waiters are served in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            sleep(wait)
+
+
+class Host:
+    '''The limits for one host: a semaphore for concurrency and a TokenBucket for rate'''
+    def __init__(self, concurrency, rate, burst=1):
+        self.concurrency = concurrency
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+
+
+def semesters(first, last=None):
+    '''Yield every semester from `first` to `last` (default: the current one), inclusive'''
+    last = last or get_semester_today()
+    for year in range(int(first[:4]), int(last[:4]) + 1):
+        for season in 'spring', 'summer', 'fall':
+            try:
+                semester = parse_semester(season, year)
+            except ValueError:  # no summer before 2014
+                continue
+            if first <= semester <= last:
+                yield semester
+
+
+def semester_name(semester):
+    'The name the makefile gives files for `semester`, e.g. Fall-2018'
+    return '%s-%s' % (get_season(semester), semester[:4])
+
+
+def jobs(kinds=('catalog', 'sections', 'exams', 'grades'), last=None, compression=''):
+    '''Return a Job for every file of `kinds` up to the semester `last`,
+    with the same paths as the makefile.
+    compression: '.gz' or '.xz' to add to every path, so the files are compressed'''
+    result = []
+    if 'catalog' in kinds:
+        result.append(Job(path.join('webpages', 'catalog.html'), SECTIONS_HOST, get_catalog))
+    for kind in 'sections', 'exams', 'grades':
+        if kind not in kinds:
+            continue
+        for semester in semesters(FIRST_SEMESTER[kind], last):
+            season, year = get_season(semester).lower(), int(semester[:4])
+            name = semester_name(semester)
+            if kind == 'sections':
+                result.append(Job(path.join('sections', name + '.html'), SECTIONS_HOST,
+                                  lambda semester=semester: get_sections(semester=semester)))
+            elif kind == 'exams':
+                result.append(Job(path.join('exams', name + '.html'), REGISTRAR_HOST,
+                                  lambda year=year, season=season: get_exam(year, season)))
+            elif semester >= '201341':  # one spreadsheet for all campuses
+                result.append(Job(path.join('grades', name + '.xlsx'), REGISTRAR_HOST,
+                                  lambda year=year, season=season: get_grades(year, season)))
+            else:
+                for campus in CAMPUSES:
+                    result.append(Job(path.join('grades', '%s-%s.pdf' % (name, campus)),
+                                      REGISTRAR_HOST,
+                                      lambda year=year, season=season, campus=campus:
+                                      get_grades(year, season, campus)))
+    return [job._replace(path=job.path + compression) for job in result]
+
+
+def verify(file_name, kind=None):
+    '''Return whether `file_name` exists and looks like a complete download.
+    Compressed files (.gz or .xz) are checked by what they uncompress to.
+    kind: the file's extension, if it isn't the end of `file_name` (without .gz or .xz)'''
+    kind = kind or path.splitext(uncompressed_name(file_name))[1]
+    try:
+        with open_compressed(file_name, 'rb') as handle:
+            head = handle.read(1024)
+            if uncompressed_name(file_name) == file_name:
+                handle.seek(max(path.getsize(file_name) - 1024, 0))
+                tail = handle.read()
+            else:  # the uncompressed size isn't known without reading it all
+                tail = head
+                for chunk in iter(lambda: handle.read(2**16), b''):
+                    tail = (tail + chunk)[-1024:]
+            if kind == '.xlsx':
+                return zipfile.is_zipfile(handle)
+    # a compressed file that was cut off, or isn't compressed the way its name says
+    except (OSError, EOFError, lzma.LZMAError):
+        return False
+    if kind == '.pdf':
+        return head.startswith(b'%PDF') and b'%%EOF' in tail
+    # html: the same check as the makefile, and the page has to have finished
+    return (b'404 page not found' not in head + tail
+            and tail.rstrip().lower().endswith(b'</html>'))
+
+
+def _run(job, host):
+    '''INTERNAL DO NOT USE'''
+    with host.semaphore:
+        host.bucket.acquire()
+        contents = job.fetch()
+    # e.g. an html error page instead of a spreadsheet
+    check = lambda tmp, final: verify(tmp, path.splitext(uncompressed_name(final))[1])
+    with atomic_output(job.path, check) as writable:
+        writable.write(contents.encode() if isinstance(contents, str) else contents)
+
+
+def download_all(all_jobs, hosts=None, workers=None):
+    '''Run every Job in `all_jobs` that doesn't already have a verified file.
+    hosts: {host: Host}; defaults to HOSTS.
+    Yields (job, result), where result is 'skipped', 'downloaded', or the exception
+    that was raised. A failed job doesn't stop the others.'''
+    if hosts is None:
+        hosts = {name: Host(*limits) for name, limits in HOSTS.items()}
+    todo = []
+    for job in all_jobs:
+        if verify(job.path):
+            yield job, 'skipped'
+        else:
+            todo.append(job)
+    if not todo:
+        return
+    # enough threads to keep every host at its limit, and no more
+    workers = workers or sum(host.concurrency for host in hosts.values())
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {pool.submit(_run, job, hosts[job.host]): job for job in todo}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                LOGGER.warning("%s: %s", job.path, e)
+                yield job, e
+            else:
+                LOGGER.info("downloaded %s", job.path)
+                yield job, 'downloaded'
@@ -2,25 +2,78 @@
 # encoding: utf-8
 '''HTML parsing. Generally, works only on files, not on strings'''
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tempfile import mkstemp  # used for downloading seats remaining
 from sys import stdout
+from os import path
 from logging import getLogger
-from datetime import datetime
+from time import perf_counter
 import csv
 import re  # used for only very basic stuff
 
 from lxml import etree
-from requests import get
 
-from gradeforge.utils import army_time, parse_semester
+from gradeforge.session import get
+from gradeforge.utils import (army_time, iso_date, parse_semester, open_input, open_compressed,
+                              uncompressed_name)
+from gradeforge.cache import cached_parse
+from gradeforge.xlsx import iter_rows
 
 BASE_URL = 'https://ssb.onecarolina.sc.edu'
 LOGGER = getLogger(__name__)
 
-def parse_catalog(file_handle, catalog_output='courses.csv', department_output='departments.csv'):
-    '''
-    file -> None
+# terms have no natural primary key, so they are numbered in the order they're seen
+Term = namedtuple('Term', ('semester', 'startDate', 'endDate',
+                           'registrationStart', 'registrationEnd'))
+
+
+class TermTable:
+    '''An ordered set of Terms, each with a stable integer id.
+    Lookups are a hash instead of the linear scan of `list.index`.
+
+    start: the id of the first term; lets several tables share one id space'''
+    def __init__(self, start=0):
+        self.start = start
+        self.ids = {}
+        self.terms = []
+
+    def intern(self, term):
+        '''Term -> int
+        Return the id of `term`, adding it to the table if it is new'''
+        try:
+            return self.ids[term]
+        except KeyError:
+            self.ids[term] = self.start + len(self.terms)
+            self.terms.append(term)
+            return self.ids[term]
+
+    def items(self):
+        '''Yield (id, term) pairs in order of id'''
+        return enumerate(self.terms, self.start)
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+CATALOG_HEADERS = ('title', 'department', 'code', 'description', 'credits',
+                   'attributes', 'level', 'type', 'all_sections', 'division')
+
+# the parse functions below run these for every row, so they're compiled once here
+CATALOG_ROWS = etree.XPath('/html/body//table[@class="datadisplaytable" and @width="100%"]/tr')
+CATALOG_CREDITS = etree.XPath('br[1]/following-sibling::text()')
+CATALOG_INFO = etree.XPath('span/following-sibling::text()')
+CREDIT_RANGE = re.compile(' +(TO|OR) +')
+DEPARTMENT_NOISE = re.compile(' Department|(USC-[AB]|Upstate|Sch of) ')
+
+
+def iter_catalog(file_handle, departments):
+    '''Yield a dict for every course in the catalog.
+    As a side effect, fills `departments` with {department: {description: times seen}};
+    pass it to most_common_departments once the generator is exhausted.
 
     TODO:
     - seperate prereqs from description
@@ -36,26 +89,9 @@ def parse_catalog(file_handle, catalog_output='courses.csv', department_output='
         - classification (Freshman, etc.)
         - other
     '''
-    if not hasattr(catalog_output, 'write'):
-        with open(catalog_output, 'w') as writable:
-            parse_catalog(file_handle, writable, department_output)
-            return
-
-    if not hasattr(department_output, 'write'):
-        with open(department_output, 'w') as writable:
-            parse_catalog(file_handle, catalog_output, writable)
-            return
-
-
-    catalog_headers = ('title', 'department', 'code', 'description', 'credits',
-                       'attributes', 'level', 'type', 'all_sections', 'division')
-    catalog = csv.DictWriter(catalog_output, catalog_headers)
-    catalog.writeheader()
-
-    departments = {}
-
-    doc = etree.parse(file_handle, parser=etree.HTMLParser())
-    rows = doc.xpath('/html/body//table[@class="datadisplaytable" and @width="100%"]/tr')
+    with open_input(file_handle) as readable:
+        doc = etree.parse(readable, parser=etree.HTMLParser())
+    rows = CATALOG_ROWS(doc)
     HEADER = True
 
     for row in rows:
@@ -66,16 +102,15 @@ def parse_catalog(file_handle, catalog_output='courses.csv', department_output='
             course_id, course['title'] = header_text[0], ' - '.join(header_text[1:]).strip()
             course['department'], course['code'] = course_id.split(' ')
         else:
-            td = row.xpath('td')[0]
+            td = row.find('td')
             course['description'] = td.text.strip()
-            credits = td.xpath('br[1]/following-sibling::text()')[0]
+            credits = CATALOG_CREDITS(td)[0]
                 # ex: '7.000    OR  8.000 Credit hours' -> '7 TO 8'
-            course['credits'] = re.sub(' +(TO|OR) +', ' TO ',
-                                       credits.replace('Credit hours', '')
-                                       .replace('.000', '')
-                                       .strip())
+            course['credits'] = CREDIT_RANGE.sub(' TO ', credits.replace('Credit hours', '')
+                                                 .replace('.000', '')
+                                                 .strip())
 
-            spans = td.xpath('span/following-sibling::text()')
+            spans = CATALOG_INFO(td)
             spans = tuple(map(lambda s: s.replace('\n', ''), filter(lambda s: s != '\n', spans)))
             course['level'], spans = spans[0], spans[1:]
 
@@ -95,8 +130,7 @@ def parse_catalog(file_handle, catalog_output='courses.csv', department_output='
 
             # store departments in their own data structure
             if department_description is not None:
-                regex = ' Department|(USC-[AB]|Upstate|Sch of) '
-                department_description = re.sub(regex, '', department_description).strip()
+                department_description = DEPARTMENT_NOISE.sub('', department_description).strip()
                 if course['department'] not in departments:
                     departments[course['department']] = defaultdict(int)
                 departments[course['department']][department_description] += 1
@@ -104,12 +138,14 @@ def parse_catalog(file_handle, catalog_output='courses.csv', department_output='
             a = td.find('a')
             if a is not None:
                 course['all_sections'] = a.attrib['href']
-            catalog.writerow(course)
+            yield course
             del course
         HEADER = not HEADER
 
-    department = csv.writer(department_output)
-    department_output.write('code,description\n')
+
+def most_common_departments(departments):
+    '''Given the departments filled in by iter_catalog,
+    yield (code, description) using the most common description for each department'''
     for abbreviation, descriptions in departments.items():
         # https://stackoverflow.com/a/613218
         final = sorted(descriptions.items(), key=lambda tup: tup[1], reverse=True)
@@ -117,7 +153,39 @@ def parse_catalog(file_handle, catalog_output='courses.csv', department_output='
         if len(final) > 1:
             LOGGER.info("%d descriptions available for '%s'; choosing the most common (%s)", len(final), abbreviation, most_common)
             LOGGER.debug("all descriptions: %s", final)
-        department.writerow((abbreviation, most_common))
+        yield abbreviation, most_common
+
+
+def parse_catalog(file_handle, catalog_output='courses.csv', department_output='departments.csv'):
+    '''
+    file -> None
+
+    Writes the courses from iter_catalog and the departments they belong to as csv files.
+    '''
+    if not hasattr(catalog_output, 'write'):
+        with open(catalog_output, 'w') as writable:
+            parse_catalog(file_handle, writable, department_output)
+            return
+
+    if not hasattr(department_output, 'write'):
+        with open(department_output, 'w') as writable:
+            parse_catalog(file_handle, catalog_output, writable)
+            return
+
+    catalog = csv.DictWriter(catalog_output, CATALOG_HEADERS)
+    catalog.writeheader()
+    departments = {}
+    catalog.writerows(iter_catalog(file_handle, departments))
+
+    department = csv.writer(department_output)
+    department_output.write('code,description\n')
+    department.writerows(most_common_departments(departments))
+
+
+# plain strings, so the instructor table doesn't keep old rows alive
+INSTRUCTOR_EMAILS = etree.XPath("td/a/@*[name()='href' or name()='target']", smart_strings=False)
+MEETING_TEXT = etree.XPath('td//text()')
+WHITESPACE = re.compile(r'\s+')
 
 
 def _add_instructors(instructors, emails, instructor_dict):
@@ -136,11 +204,11 @@ def _parse_instructors(row, instructors, instructor_dict):
     if instructors == 'TBA':
         return instructors, None
 
-    email_struct = row.xpath("td/a/@*[name()='href' or name()='target']")
+    email_struct = INSTRUCTOR_EMAILS(row)
 
     if not email_struct:
         LOGGER.debug(instructors)
-        instructors = re.sub(r'\s+', ' ', instructors).replace(' (P)', '').split(',')
+        instructors = WHITESPACE.sub(' ', instructors).replace(' (P)', '').split(',')
         LOGGER.info("No emails present for instructors %s", instructors)
     else:
         instructors, emails = email_struct[1::2], email_struct[::2]
@@ -151,7 +219,7 @@ def _parse_instructors(row, instructors, instructor_dict):
 
 
 def _parse_inner_row(row, course, term, instructor_dict):
-    table_info = row.xpath('td//text()')
+    table_info = MEETING_TEXT(row)
     if not table_info:  # independent study; this is handled on the frontend
         for key in ['days', 'location', 'startTime', 'endTime',
                     'instructor']:
@@ -170,8 +238,158 @@ def _parse_inner_row(row, course, term, instructor_dict):
         term['startDate'], term['endDate'] = dates.split(' - ')
 
 
+SECTION_ROWS = etree.XPath('/html/body//table[@class="datadisplaytable" and @width="100%"][1]'
+                           '/tr[position() > 2]')
+
+# what the makefile used to do to sections pages with sed before parsing them.
+# the regexes only run on lines that have the first string; most don't
+SECTION_REPAIRS = (
+    # two opening tags where there should be an opening and a closing one
+    (b'<b>', re.compile(rb'<b>(.*)<b>'), rb'<b>\1</b>'),
+    # the school seems to think <p> is the same as <br>
+    (b' <p>', re.compile(rb' <p>$'), b''))
+
+
+class RepairedSections:
+    '''A binary file that reads the sections page in the binary file `readable`,
+    with SECTION_REPAIRS made to each line on the way. Only a line at a time is
+    held in memory besides what lxml asks for, so it can be streamed.
+    libxml2's HTML parser recovers from everything else that `tidy` used to clean up.'''
+    def __init__(self, readable):
+        self.lines = iter(readable)
+        self.buffer = bytearray()
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            for marker, expr, replacement in SECTION_REPAIRS:
+                if marker in line:
+                    line = expr.sub(replacement, line, count=1)
+            self.buffer += line
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def _section_rows(file_handle):
+    '''Return every row of the sections table, holding the whole document in memory'''
+    with open_input(file_handle) as readable:
+        doc = etree.parse(RepairedSections(readable), etree.HTMLParser())
+    rows = SECTION_ROWS(doc)
+    assert not len(rows) & 1  # even
+    return rows
+
+
+def _stream_section_rows(file_handle, skip=2):
+    '''Generator version of _section_rows. Each row is cleared from the tree,
+    along with everything before it, as soon as the caller asks for the next one,
+    so memory use doesn't grow with the size of the document.
+    Stops reading once the sections table is closed.'''
+    table = None
+    position = 0
+    with open_input(file_handle) as readable:
+        for event, element in etree.iterparse(RepairedSections(readable), events=('start', 'end'),
+                                              html=True):
+            if element.tag == 'table':
+                if table is None and event == 'start' \
+                        and element.get('class') == 'datadisplaytable' \
+                        and element.get('width') == '100%':
+                    table = element
+                elif event == 'end' and element is table:
+                    break
+            # rows of the tables nested inside each section have a different parent
+            elif event == 'end' and element.tag == 'tr' and table is not None \
+                    and element.getparent() is table:
+                position += 1
+                if position > skip:
+                    yield element
+                element.clear()
+                while element.getprevious() is not None:
+                    del table[0]
+    assert position < skip or not (position - skip) & 1  # even
+
+
+SECTION_HEADERS = ('department', 'code', 'section', 'UID', 'term', 'campus',
+                   'type', 'method', 'days', 'location', 'startTime', 'endTime',
+                   'primary_instructor', 'secondary_instructors', 'syllabus', 'attributes')
+
+SECTION_TITLE = etree.XPath('th/a[1]/text()')
+SECTION_INFO = etree.XPath('(.|a|b|p)/span/following-sibling::text()')
+SECTION_SYLLABUS = etree.XPath('(.|b|p)/a[position() = 3]/@href')
+SECTION_MEETINGS = etree.XPath('table/tr[2]')
+DASH = re.compile(r'\W-\W')
+NOT_WORD = re.compile(r'\W+')
+
+
+def iter_sections(file_handle, instructor_dict, terms, stream=False):
+    '''Yield a dict for every section in `file_handle`; see parse_sections.
+    Instructors are added to `instructor_dict` ({name: email}) and each section's
+    'term' is its id in `terms`, a TermTable. Sharing these between files
+    gives every semester the same instructor and term ids.'''
+    rows = _stream_section_rows(file_handle) if stream else _section_rows(file_handle)
+    HEADER = True
+    for row in rows:
+        if HEADER:
+            course = {}
+            text = DASH.split(SECTION_TITLE(row)[0])
+            # everything before last three is title
+            course['UID'], course_id, course['section'] = text[-3:]
+            course['department'], course['code'] = NOT_WORD.split(course_id)
+        else:
+            main = row.find('td')
+
+            after = SECTION_INFO(main)
+            after = tuple(map(str.strip, filter(lambda x: x != '\n', after)))
+
+            term = {}
+            try:  # this is always first point of failure for parser
+                semester_raw, registration = after[:2]  # third is level, which we know
+            except Exception:
+                LOGGER.debug("%s %s %s %s", after, course, list(main), text)
+                raise
+
+            term['semester'] = parse_semester(*NOT_WORD.split(semester_raw))
+            term['registrationStart'], term['registrationEnd'] = (NOT_WORD.sub(' ', s) for s in
+                                                                  registration.split(' to '))
+
+            if len(after) == 8:
+                course['attributes'] = after[3]
+            campus, schedule_type, method = after[-4:-1]  # last is credits
+            course['campus'] = campus.replace('USC ', '').replace(' Campus', '')
+            course['type'] = schedule_type.replace(' Schedule Type', '')
+            course['method'] = method.replace(' Instructional Method', '')
+
+            syllabus = SECTION_SYLLABUS(main)
+            if syllabus:
+                if syllabus[0].startswith('/'):
+                    course['syllabus'] = BASE_URL + syllabus[0]
+                else:
+                    LOGGER.debug("syllabus '%s' doesn't start with '/'", syllabus)
+                    course['syllabus'] = syllabus[0]
+
+            inner_row = SECTION_MEETINGS(main)
+            if inner_row:
+                assert len(inner_row) == 1, (row, course)
+                _parse_inner_row(inner_row[0], course, term, instructor_dict)
+
+            for key, value in term.items():
+                if key != 'semester' and value is not None:
+                    term[key] = iso_date(value)
+            course['term'] = terms.intern(Term._make(map(term.get, Term._fields)))
+            yield course
+            # error instead of silently addding wrong info when rows/headers out of order
+            del course
+        HEADER = not HEADER
+
+
+
 def parse_sections(file_handle, instructor_output='instructors.csv',
-                   term_output='semesters.csv', section_output='sections.csv'):
+                   term_output='semesters.csv', section_output='sections.csv',
+                   stream=False):
     '''file_handle -> None
 
     Parses sections of a course
@@ -209,27 +427,28 @@ def parse_sections(file_handle, instructor_output='instructors.csv',
     - figure out why start_date and end_date are sometimes the same
     - department is overwritten by last seen, so there's a lot of stuff specific to upstate
     - fix misc screwiness
+
+    If `stream` is true, rows are read incrementally instead of building the
+    whole document first. The output is the same, but memory use stays flat
+    no matter how large the semester is.
     '''
 
     if not hasattr(instructor_output, 'write'):
         with open(instructor_output, 'w') as writable:
-            parse_sections(file_handle, writable, term_output, section_output)
+            parse_sections(file_handle, writable, term_output, section_output, stream)
             return
 
     if not hasattr(term_output, 'write'):
         with open(term_output, 'w') as writable:
-            parse_sections(file_handle, instructor_output, writable, section_output)
+            parse_sections(file_handle, instructor_output, writable, section_output, stream)
             return
 
     if not hasattr(section_output, 'write'):
         with open(section_output, 'w') as writable:
-            parse_sections(file_handle, instructor_output, term_output, writable)
+            parse_sections(file_handle, instructor_output, term_output, writable, stream)
             return
 
-    headers = ('department', 'code', 'section', 'UID', 'term', 'campus',
-               'type', 'method', 'days', 'location', 'startTime', 'endTime',
-               'primary_instructor', 'secondary_instructors', 'syllabus', 'attributes')
-    sections = csv.DictWriter(section_output, headers)
+    sections = csv.DictWriter(section_output, SECTION_HEADERS)
     sections.writeheader()
 
     # these allow constant-time lookups to see if a key is already present,
@@ -237,101 +456,31 @@ def parse_sections(file_handle, instructor_output='instructors.csv',
     # the reason for lookups is because the parsing is still imperfect;
     # this allows warning when a key already exists in the dict
     instructor_dict = {}
-    # this should be a set but we need a primary key; index serves this purpose
-    # TODO: switch to ordered set: https://pypi.org/project/ordered-set/
-    # see https://github.com/jyn514/GradeForge/issues/20 for details
-    terms = []
-
-    doc = etree.parse(file_handle, etree.HTMLParser())
-    rows = doc.xpath('/html/body//table[@class="datadisplaytable" '
-                                       'and @width="100%"][1]/tr[position() > 2]')
-    assert not len(rows) & 1  # even
-    HEADER = True
-    for row in rows:
-        if HEADER:
-            course = {}
-            text = re.split(r'\W-\W', row.xpath('th/a[1]/text()')[0])
-            # everything before last three is title
-            course['UID'], course_id, course['section'] = text[-3:]
-            course['department'], course['code'] = re.split(r'\W+', course_id)
-        else:
-            main = row.xpath('td[1]')[0]
-
-            after = main.xpath('(.|a|b|p)/span/following-sibling::text()')
-            after = tuple(map(str.strip, filter(lambda x: x != '\n', after)))
-
-            term = {}
-            try:  # this is always first point of failure for parser
-                semester_raw, registration = after[:2]  # third is level, which we know
-            except Exception:
-                LOGGER.debug("%s %s %s %s", after, course, list(main), text)
-                raise
-
-            term['semester'] = parse_semester(*re.split(r'\W+', semester_raw))
-            term['registrationStart'], term['registrationEnd'] = map(lambda s: re.sub(r'\W+', ' ', s),
-                                                                     registration.split(' to '))
-
-            if len(after) == 8:
-                course['attributes'] = after[3]
-            campus, schedule_type, method = after[-4:-1]  # last is credits
-            course['campus'] = campus.replace('USC ', '').replace(' Campus', '')
-            course['type'] = schedule_type.replace(' Schedule Type', '')
-            course['method'] = method.replace(' Instructional Method', '')
-
-            syllabus = main.xpath('(.|b|p)/a[position() = 3]/@href')
-            if syllabus:
-                if syllabus[0].startswith('/'):
-                    course['syllabus'] = BASE_URL + syllabus[0]
-                else:
-                    LOGGER.debug("syllabus '%s' doesn't start with '/'", syllabus)
-                    course['syllabus'] = syllabus[0]
-
-            inner_row = main.xpath('table/tr[2]')
-            if inner_row:
-                assert len(inner_row) == 1, (row, course)
-                _parse_inner_row(inner_row[0], course, term, instructor_dict)
-
-            for key, value in term.items():
-                if key != 'semester' and value is not None:
-                    'Aug 24, 2018 -> 2018-08-24'
-                    term[key] = datetime.strptime(value.replace(',', ''),
-                                                  "%b %d %Y").date().isoformat()
-            try:
-                course['term'] = terms.index(term)
-            except ValueError:
-                terms.append(term)
-                course['term'] = len(terms) - 1
-            sections.writerow(course)
-            # error instead of silently addding wrong info when rows/headers out of order
-            del course
-        HEADER = not HEADER
+    # see https://github.com/jyn514/GradeForge/issues/20 for why this is ordered
+    terms = TermTable()
+    sections.writerows(iter_sections(file_handle, instructor_dict, terms, stream))
 
     instructors = csv.writer(instructor_output)
     instructor_output.write('name, email\n')
     instructors.writerows(instructor_dict.items())
 
-    headers = 'semester', 'startDate', 'endDate', 'registrationStart', 'registrationEnd'
-    term_writer = csv.DictWriter(term_output, headers)
-    term_writer.writeheader()
+    term_writer = csv.writer(term_output)
+    term_writer.writerow(Term._fields)
     term_writer.writerows(terms)
 
 
-def parse_exam(file_handle, output=stdout):
-    '''Writes a csv to `output`, with headers.
-    Quite fast compared to parse_sections, but it's handling less data.
+EXAM_HEADERS = 'semester', 'days', 'time_met', 'exam_date', 'exam_time'
 
-    Params:
-        - file_handle: str or implements `read`
-        - semester: the semester to use for every exam in the csv.
-                    default is to infer from file_handle name.
-                    custom is to use USC semester (use utils.parse_semester).
-        - output: same type as file_handle, where to write the csv
-    '''
-    if not hasattr(output, 'write'):
-        with open(output, 'w') as writable:
-            parse_exam(file_handle, writable)
-            return
+EXAM_DASH = re.compile(r'\s*[–-]\s*')
+ORDINAL = re.compile(r'(th|nd|st|rd)\s*$')
+SESSION = re.compile(r'\(([0-9][A-Z])\)')
+MEETING_DAYS = re.compile(r'\s*[MTWRFSU]+\s+(-\s+)?')
+TIME_LIST = re.compile(', ?')
 
+
+def iter_exam(file_handle):
+    '''Yield a dict for every exam time in `file_handle` (str or implements `read`).
+    The semester is read from the title of the page.'''
     def parse_days(text):
         '''
         'Monday/Wednesday/Friday Meeting Times' -> 'MWF'
@@ -370,7 +519,7 @@ def parse_exam(file_handle, output=stdout):
             exam_time = None
             exam_date = datetime.split(',')[0]
         else:
-            date, time = re.split(r'\s*[–-]\s*', datetime)
+            date, time = EXAM_DASH.split(datetime)
             # case 2
             if 'normal class meeting time' in time.lower():
                 exam_time = None
@@ -383,19 +532,17 @@ def parse_exam(file_handle, output=stdout):
             else:
                 exam_time = army_time(time)
                 exam_date = date[date.index(' ') + 1:]
-        exam_date = re.sub(r'(th|nd|st|rd)\s*$', '', exam_date).replace('.', '')
+        exam_date = ORDINAL.sub('', exam_date).replace('.', '')
         return exam_date, exam_time
 
-    doc = etree.parse(file_handle, etree.HTMLParser())
+    with open_input(file_handle) as readable:
+        doc = etree.parse(readable, etree.HTMLParser())
 
     title = doc.xpath('/html/head/title/text()')[0]
     semester = title.split(' - ')[0].replace('Final Exam Schedule ', '')
     semester = parse_semester(*semester.split(' '))
 
     div = doc.xpath('/html/body/section/div/div/section[2]/div/section/div/div/section')[0]
-    csv_headers = 'semester', 'days', 'time_met', 'exam_date', 'exam_time'
-    writer = csv.DictWriter(output, csv_headers)
-    writer.writeheader()
 
     headers = div.xpath('div[@class="accordion-summary"]/h5')
     bodies = div.xpath('div[@class="accordion-details"]/table/tbody')
@@ -404,7 +551,7 @@ def parse_exam(file_handle, output=stdout):
             days_met = parse_days(header.text)
         # given session, not days. Ex: 'Spring I (3A) and Spring II (3B)'
         except KeyError:
-            terms = re.findall(r'\(([0-9][A-Z])\)', header.text)
+            terms = SESSION.findall(header.text)
             days_met = ','.join(terms)
 
         for row in bodies[i].findall('tr'):
@@ -424,11 +571,11 @@ def parse_exam(file_handle, output=stdout):
                     exam_time = 'any'
                 current.update({'time_met': 'any', 'exam_time': exam_time,
                                 'exam_date': exam_date})
-                writer.writerow(current)
+                yield current
             else:
-                split = re.split(r'\s*[MTWRFSU]+\s+(-\s+)?', time_met)
+                split = MEETING_DAYS.split(time_met)
                 # example: '8:30 a.m.,11:40 a.m., 2:50 p.m., 6:00 p.m.'
-                for time in re.split(', ?', split[-1]):
+                for time in TIME_LIST.split(split[-1]):
                     time = army_time(time)
                     copy = current.copy()
                     if exam_time is None:
@@ -436,7 +583,26 @@ def parse_exam(file_handle, output=stdout):
                     else:
                         copy['exam_time'] = exam_time
                     copy.update({'time_met': time, 'exam_date': exam_date})
-                    writer.writerow(copy)
+                    yield copy
+
+
+def parse_exam(file_handle, output=stdout):
+    '''Writes a csv to `output`, with headers.
+    Quite fast compared to parse_sections, but it's handling less data.
+
+    Params:
+        - file_handle: str or implements `read`
+        - output: same type as file_handle, where to write the csv
+    '''
+    if not hasattr(output, 'write'):
+        with open(output, 'w') as writable:
+            parse_exam(file_handle, writable)
+            return
+
+    writer = csv.DictWriter(output, EXAM_HEADERS)
+    writer.writeheader()
+    writer.writerows(iter_exam(file_handle))
+
 
 def get_seats(section_link):
     'str -> (capacity, taken, remaining)'
@@ -470,7 +636,8 @@ def parse_bookstore(file_handle, output=stdout):
         with open(output, 'w') as writable:
             parse_bookstore(file_handle, writable)
             return
-    doc = etree.parse(file_handle, etree.HTMLParser())
+    with open_input(file_handle) as readable:
+        doc = etree.parse(readable, etree.HTMLParser())
     xpath = ('/html/body/header/section/div[@class="courseMaterialsList"]'
              '/div/form[@id="courseListForm"]')
     form = doc.xpath(xpath)[0]
@@ -504,22 +671,27 @@ def parse_bookstore(file_handle, output=stdout):
         writer.writerow(info)
 
 
-def parse_grades(file_handle, output=stdout):
-    '''File_handle is assumed to contain the output of `pdftotext -layout <pdf>`'''
-    if not hasattr(file_handle, 'read'):
-        with open(file_handle) as readable:
-            parse_grades(readable, output)
-            return
+# compiled once, rather than looked up in re's cache for every line of every spread
+GRADE_TITLE = re.compile(r'\s?GRADE\s?(SPREAD FOR|DISTRIBUTION)')
+GRADE_SEMESTER = re.compile(r'(FALL|SUMMER|SPRING)?\s?([0-9]{4})', re.IGNORECASE)
+GRADE_CAMPUS = re.compile(r'((THE\s)?UNIVERSITY\sOF\sSOUTH\sCAROLINA\s?([‐-]|at)\s?|USC[‐\s-])'
+                          r'([^:]*)', re.IGNORECASE)
+GRADE_HEADER_LINE = re.compile(r'\s*DEP(ar)?T', re.IGNORECASE)
+GRADE_HEADER_RENAMES = ((re.compile(r'DEP(AR)?T(\.|MENT)?'), 'DEPARTMENT'),
+                        (re.compile(r'SEC(T(ION)?)?\.?'), 'SECTION'),
+                        (re.compile(r'C(OU)?RSE(\s?#)?'), 'CODE'))
+# pages sent to a worker at once by grade_pages
+PAGES_PER_TASK = 8
 
-    if not hasattr(output, 'write'):
-        with open(output, 'w') as writable:
-            parse_grades(file_handle, writable)
-            return
 
+def _grade_header(file_handle):
+    '''INTERNAL DO NOT USE
+    reads a pdftotext grade spread up to and including the column headers;
+    returns (semester, campus, headers)'''
     while True:  # sometimes header is not on first line
         metadata = next(file_handle).strip()
-        metadata = re.sub(r'\s?GRADE\s?(SPREAD FOR|DISTRIBUTION)', '', metadata)
-        match = re.search(r'(FALL|SUMMER|SPRING)?\s?([0-9]{4})', metadata, re.IGNORECASE)
+        metadata = GRADE_TITLE.sub('', metadata)
+        match = GRADE_SEMESTER.search(metadata)
         if match is not None:
             season, year = match.groups()
             break
@@ -528,8 +700,7 @@ def parse_grades(file_handle, output=stdout):
         season = 'spring'
     semester = parse_semester(season, year)
     try:
-        expr = r'((THE\s)?UNIVERSITY\sOF\sSOUTH\sCAROLINA\s?([‐-]|at)\s?|USC[‐\s-])([^:]*)'
-        campus = re.search(expr, metadata, flags=re.IGNORECASE)
+        campus = GRADE_CAMPUS.search(metadata)
         campus = re.sub(r'\sCAMPUS', '', campus.groups()[0]).upper()
     except Exception:
         LOGGER.debug(metadata)
@@ -540,19 +711,193 @@ def parse_grades(file_handle, output=stdout):
         except StopIteration:
             LOGGER.debug(file_handle)
             raise
-        if re.match(r'\s*DEP(ar)?T', headers, flags=re.IGNORECASE) is not None:
+        if GRADE_HEADER_LINE.match(headers) is not None:
             headers = headers.upper()
-            headers = re.sub(r'DEP(AR)?T(\.|MENT)?', 'DEPARTMENT', headers)
-            headers = re.sub(r'SEC(T(ION)?)?\.?', 'SECTION', headers)
-            headers = re.sub(r'C(OU)?RSE(\s?#)?', 'CODE', headers)
+            for expr, replacement in GRADE_HEADER_RENAMES:
+                headers = expr.sub(replacement, headers)
             headers = headers.replace('DEPARTMENT/CODE', 'DEPARTMENT CODE')
             headers = headers.replace('AUD', 'AUDIT')
             headers = re.sub(r'\sI\s', ' INCOMPLETE ', headers).split()
             break
     if len(headers) < 18:
         raise ValueError("Bad value '%s' for headers" % headers)
-    output.write(','.join(['SEMESTER', 'CAMPUS'] + headers) + '\n')
-    # all of these functions are generators, which require very low memory usage
-    csv.writer(output).writerows(map(lambda s: [semester, campus] + s,
-                                     filter(lambda l: len(l) == len(headers),
-                                            map(str.split, file_handle))))
+    return semester, campus, headers
+
+
+def grade_rows(file_handle):
+    '''Given an open file containing the output of `pdftotext -layout <pdf>`,
+    return (headers, rows), where rows is an iterator of lists.
+    Rows are read lazily, so the file has to stay open until they are used up.'''
+    semester, campus, headers = _grade_header(file_handle)
+    width = len(headers)
+    # generators all the way down, which require very low memory usage
+    return ['SEMESTER', 'CAMPUS'] + headers, ([semester, campus] + row
+                                              for row in map(str.split, file_handle)
+                                              if len(row) == width)
+
+
+def _page_rows(page, width):
+    '''INTERNAL DO NOT USE
+    runs in a worker process; the rows of one page, the same way grade_rows picks them'''
+    return [row for row in map(str.split, page.split('\n')) if len(row) == width]
+
+
+def grade_pages(file_handle, jobs=None):
+    '''The same as grade_rows, but the pages after the column headers (pdftotext
+    separates them with form feeds) are split up in a pool of `jobs` processes
+    (default: one per CPU). The rows are in the same order as grade_rows.
+    The rest of the file is read as soon as this is called.'''
+    semester, campus, headers = _grade_header(file_handle)
+    width, pages = len(headers), file_handle.read().split('\f')
+
+    def rows():
+        with ProcessPoolExecutor(jobs) as pool:
+            for page in pool.map(_page_rows, pages, repeat(width), chunksize=PAGES_PER_TASK):
+                for row in page:
+                    yield [semester, campus] + row
+    return ['SEMESTER', 'CAMPUS'] + headers, rows()
+
+
+# what the makefile used to do to the first line of `xlsx2csv` output with sed, in order.
+# each is applied to the whole header line, once (count 1) or everywhere (count 0).
+# two differ from sed, which treats + and ? as literal characters:
+# - `s/\([A-DF]+?\)_GF/\1/g` never matched, and GRADE_HEADERS keeps the _GF columns,
+#   so it isn't here.
+# - `s/No ?Grade/No Grade/` only matched the text 'No ?Grade'. Here the ? is optional,
+#   so 'NoGrade' also becomes 'No Grade', the column name in GRADE_HEADERS.
+XLSX_HEADERS = tuple((re.compile(expr), replacement, count) for expr, replacement, count in (
+    (r'COURSE_SECTION', 'SECTION', 1),
+    (r'_NUMBER', '', 0),
+    (r'No ?Grade', 'No Grade', 1),
+    (r'Num Grades Posted', 'TOTAL', 1),
+    (r'(?i)Incomplete', 'INCOMPLETE', 1),
+    (r'SUBJECT', 'DEPARTMENT', 1),
+    (r'COURSE', 'CODE', 1)))
+
+
+def is_xlsx(file_handle):
+    '''Whether `file_handle` (a path or an open file) is a new style grade spread'''
+    return str(getattr(file_handle, 'name', file_handle)).endswith('.xlsx')
+
+
+def semester_from_name(file_name):
+    '''Example: 'grades/Fall-2014.xlsx' -> '201408' '''
+    season, year = path.basename(str(file_name)).split('.')[0].split('-')[:2]
+    return parse_semester(season, year)
+
+
+def xlsx_grade_rows(file_handle, semester=None):
+    '''Given a grade spread from fall 2013 on (an xlsx file, either a path
+    or an open binary file), return (headers, rows) the same as grade_rows.
+    The headers are renamed to match the old grade spreads (see XLSX_HEADERS).
+    CAMPUS is always empty, since these spreads cover every campus at once.
+    semester: default is the one in the file name, e.g. grades/Fall-2014.xlsx
+    Rows are read lazily, so an open file has to stay open until they are used up.'''
+    if semester is None:
+        semester = semester_from_name(getattr(file_handle, 'name', file_handle))
+    rows = iter_rows(file_handle)
+    headers = ','.join(next(rows)).rstrip(',')
+    for expr, replacement, count in XLSX_HEADERS:
+        headers = expr.sub(replacement, headers, count)
+    headers = headers.split(',')
+    width = len(headers)
+    return ['SEMESTER', 'CAMPUS'] + headers, ([semester, ''] + (row + [''] * width)[:width]
+                                              for row in rows if any(row))
+
+
+def iter_grades(file_handle):
+    '''Yield a dict for every section in a grade spread; see grade_rows and xlsx_grade_rows'''
+    if is_xlsx(file_handle):
+        headers, rows = xlsx_grade_rows(file_handle)
+    elif not hasattr(file_handle, 'read'):
+        with open_compressed(file_handle) as readable:
+            yield from iter_grades(readable)
+            return
+    else:
+        headers, rows = grade_rows(file_handle)
+    for row in rows:
+        yield dict(zip(headers, row))
+
+
+def parse_grades(file_handle, output=stdout, pages=None):
+    '''File_handle is assumed to contain the output of `pdftotext -layout <pdf>`,
+    or to be an xlsx grade spread if its name ends with .xlsx
+    pages: split up the pages of a pdftotext spread in this many processes
+           (0 for one per CPU; see grade_pages) instead of one line at a time'''
+    if not hasattr(file_handle, 'read') and not is_xlsx(file_handle):
+        with open_compressed(file_handle) as readable:
+            parse_grades(readable, output, pages)
+            return
+
+    if not hasattr(output, 'write'):
+        with open(output, 'w') as writable:
+            parse_grades(file_handle, writable, pages)
+            return
+
+    if is_xlsx(file_handle):
+        headers, rows = xlsx_grade_rows(file_handle)
+    elif pages is not None:
+        headers, rows = grade_pages(file_handle, pages or None)
+    else:
+        headers, rows = grade_rows(file_handle)
+    output.write(','.join(headers) + '\n')
+    csv.writer(output).writerows(rows)
+
+
+# info -> (parse function, {output keyword: suffix of the file it is written to})
+# the suffixes are the ones used by the makefile,
+# e.g. sections/Fall-2017.html -> sections/Fall-2017.instructors.csv
+BATCH = {'exam': (parse_exam, {'output': '.csv'}),
+         'bookstore': (parse_bookstore, {'output': '.csv'}),
+         'grades': (parse_grades, {'output': '.csv'}),
+         'catalog': (parse_catalog, {'catalog_output': '.csv',
+                                     'department_output': '.departments.csv'}),
+         'sections': (parse_sections, {'section_output': '.csv',
+                                       'instructor_output': '.instructors.csv',
+                                       'term_output': '.terms.csv'})}
+
+
+def output_paths(info, file_name):
+    '''Return the output keyword arguments for parsing `file_name` as `info`.
+    Example: output_paths('catalog', 'webpages/catalog.html')
+        -> {'catalog_output': 'webpages/catalog.csv',
+            'department_output': 'webpages/catalog.departments.csv'}'''
+    base = path.splitext(uncompressed_name(file_name))[0]
+    return {keyword: base + suffix for keyword, suffix in BATCH[info][1].items()}
+
+
+def _parse_one(info, file_name, kwargs, cache_dir):
+    '''INTERNAL DO NOT USE
+    runs in a worker process; returns how long the parse took and whether it was cached'''
+    start = perf_counter()
+    function, outputs = BATCH[info][0], output_paths(info, file_name)
+    if cache_dir is None:
+        function(file_name, **outputs, **kwargs)
+        hit = False
+    else:
+        hit = cached_parse(function, file_name, outputs, cache_dir=cache_dir, **kwargs)
+    return perf_counter() - start, hit
+
+
+def parse_many(info, file_names, jobs=None, cache_dir=None, **kwargs):
+    '''Parse every file in `file_names` as `info` (one of the keys of BATCH),
+    using a pool of `jobs` processes (default: one per CPU).
+    Each input gets its own outputs, named by `output_paths`.
+    If `cache_dir` is given, inputs that were parsed before are copied from
+    the cache instead (see gradeforge.cache).
+    Any other keyword arguments are passed to the parse function.
+
+    Yields (file_name, seconds, whether it was cached) as each file finishes.
+    If a file fails to parse, files that haven't started yet are cancelled
+    and the exception is raised once the running ones are done.'''
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(_parse_one, info, file_name, kwargs, cache_dir): file_name
+                   for file_name in file_names}
+        for future in as_completed(futures):
+            try:
+                seconds, hit = future.result()
+            except Exception:
+                for pending in futures:
+                    pending.cancel()
+                raise
+            yield futures[future], seconds, hit
@@ -0,0 +1,204 @@
+'''Parse downloaded files straight into the database.
+
+The makefile writes a CSV for every semester, combines those into giant CSVs,
+then reads them back in with `sql.create`, so every row is serialized and parsed
+three times. This skips the CSV files entirely: the parse functions yield rows,
+which are inserted in batches as they come. Term ids are global from the start,
+so they don't need to be renumbered afterwards.
+
+The CSV files are still available with `gradeforge parse` if you want them.
+
+`update` does the same for a single semester of an existing database,
+which is all that changes from night to night.'''
+
+import csv
+import sqlite3
+from collections import OrderedDict
+from glob import glob
+from itertools import islice
+from logging import getLogger
+from os import path
+
+from .combine import GRADE_HEADERS
+from .parse import (SECTION_HEADERS, CATALOG_HEADERS, EXAM_HEADERS, Term, TermTable,
+                    iter_sections, iter_catalog, iter_exam, iter_grades,
+                    most_common_departments)
+from .sql import create_tables, create_indexes, insert_command, bulk_load
+from .utils import DEFAULT_DATABASE, get_season, open_compressed, uncompressed_name
+
+LOGGER = getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# tables that hold one row per semester (or per section in a semester),
+# and which rows of them belong to the semester given as the only parameter.
+# section comes before term, since sections are found through their terms
+SEMESTER_ROWS = OrderedDict((('section', 'term IN (SELECT id FROM term WHERE semester = ?)'),
+                             ('term', 'semester = ?'),
+                             ('exam', 'semester = ?'),
+                             ('grade', 'semester = ?')))
+
+
+def insert_records(connection, table, headers, records, conflict=None):
+    '''Insert the dicts in `records` into `table`, BATCH_SIZE rows at a time.
+    Missing or None values are inserted as '', the same as in the CSV files.
+    Returns the number of rows inserted.'''
+    command = insert_command(table, headers, conflict)
+    rows = (tuple('' if record.get(key) is None else record[key] for key in headers)
+            for record in records)
+    count = 0
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return count
+        connection.executemany(command, batch)
+        count += len(batch)
+
+
+def _grade_records(file_name):
+    '''INTERNAL DO NOT USE
+    grade spreads are pdftotext output, xlsx, or CSV files'''
+    if not uncompressed_name(file_name).endswith('.csv'):
+        yield from iter_grades(file_name)
+        return
+    with open_compressed(file_name) as readable:
+        reader = csv.DictReader(readable)
+        unknown = set(reader.fieldnames or ()) - set(GRADE_HEADERS)
+        if unknown:
+            LOGGER.warning("%s: ignoring unknown columns %s", file_name, sorted(unknown))
+        yield from reader
+
+
+def load(connection, catalogs=(), sections=(), exams=(), grades=(), terms=None, stream=True):
+    '''Parse every file given and insert the results into the tables created by
+    `sql.create_tables`. Instructors and departments that are already present are kept.
+
+    terms: the TermTable to number terms with; pass one with a higher `start`
+           to add to a database that already has terms.
+    stream: passed to iter_sections.
+
+    Returns the TermTable.'''
+    if terms is None:
+        terms = TermTable()
+
+    for file_name in catalogs:
+        departments = {}
+        count = insert_records(connection, 'class', CATALOG_HEADERS,
+                               iter_catalog(file_name, departments))
+        insert_records(connection, 'department', ('code', 'description'),
+                       (dict(zip(('code', 'description'), department))
+                        for department in most_common_departments(departments)),
+                       conflict='IGNORE')
+        LOGGER.info("%s: %d courses", file_name, count)
+
+    # every semester shares one id space for terms, so there's nothing to remap later
+    first_term = terms.start + len(terms)
+    for file_name in sections:
+        instructors = {}
+        count = insert_records(connection, 'section', SECTION_HEADERS,
+                               iter_sections(file_name, instructors, terms, stream))
+        insert_records(connection, 'instructor', ('name', 'email'),
+                       ({'name': name, 'email': email} for name, email in instructors.items()),
+                       conflict='IGNORE')
+        LOGGER.info("%s: %d sections", file_name, count)
+    insert_records(connection, 'term', ('id',) + Term._fields,
+                   (dict(term._asdict(), id=i) for i, term in terms.items()
+                    if i >= first_term))
+
+    for file_name in exams:
+        count = insert_records(connection, 'exam', EXAM_HEADERS, iter_exam(file_name))
+        LOGGER.info("%s: %d exams", file_name, count)
+
+    for file_name in grades:
+        count = insert_records(connection, 'grade', GRADE_HEADERS, _grade_records(file_name))
+        LOGGER.info("%s: %d grades", file_name, count)
+
+    return terms
+
+
+def build(database=DEFAULT_DATABASE, catalogs=(), sections=(), exams=(), grades=(),
+          stream=True, bulk=False):
+    '''Create a new database at `database` from the downloaded files, without any
+    intermediate CSV files. See `load` for the arguments, and `sql.create` for `bulk`.'''
+    with sqlite3.connect(database) as connection:
+        create_tables(connection)
+        with bulk_load(connection) if bulk else connection:
+            load(connection, catalogs, sections, exams, grades, stream=stream)
+            create_indexes(connection)
+
+
+def semester_files(semester, sections_dir='sections', exams_dir='exams', grades_dir='grades'):
+    '''Return the downloads the makefile keeps for `semester` as keyword arguments
+    for `update`, e.g. sections/Fall-2018.html. Files that don't exist are left out.'''
+    name = '%s-%s' % (get_season(semester), str(semester)[:4])
+    def existing(*patterns):
+        return sorted(file_name for pattern in patterns for file_name in glob(pattern))
+    return {'sections': existing(path.join(sections_dir, name + '.html')),
+            'exams': existing(path.join(exams_dir, name + '.html')),
+            # new grade spreads are one xlsx per semester (or the CSV xlsx2csv used to make
+            # from it, but never both), old ones one PDF per campus
+            'grades': (existing(path.join(grades_dir, name + '.xlsx'))
+                       or existing(path.join(grades_dir, name + '.csv')))
+                      + existing(path.join(grades_dir, name + '-*.txt'))}
+
+
+def update(semester, database=DEFAULT_DATABASE, sections=None, exams=None, grades=None,
+           catalogs=(), stream=True):
+    '''Replace everything `database` has for one semester, in a single transaction,
+    instead of recreating the whole database.
+
+    sections, exams, grades: files to load. Each defaults to `semester_files(semester)`.
+        Tables are only replaced if there are files for them, so a semester that
+        doesn't have grades yet keeps whatever grades it had (usually none).
+        Sections replace both the `section` and `term` tables.
+    catalogs: catalog pages to load. The catalog isn't split by semester, so these
+        replace the whole `class` table. Not loaded unless given.
+    Instructors and departments are merged by key; ones already present are kept.
+
+    Raises ValueError and leaves the database untouched if any file turns out to be
+    for a different semester.
+    Returns {table: (rows deleted, rows inserted)}.'''
+    semester = str(semester)
+    defaults = semester_files(semester)
+    files = {'sections': defaults['sections'] if sections is None else sections,
+             'exams': defaults['exams'] if exams is None else exams,
+             'grades': defaults['grades'] if grades is None else grades,
+             'catalogs': catalogs}
+    source = {'section': 'sections', 'term': 'sections', 'exam': 'exams', 'grade': 'grades',
+              'class': 'catalogs', 'department': 'catalogs'}
+    # which rows of each table get replaced. departments are only ever added to
+    replace = OrderedDict(SEMESTER_ROWS, **{'class': '1', 'department': '0'})
+    tables = [table for table in replace if files[source[table]]]
+    if not tables:
+        raise ValueError("no files to update %s from" % semester)
+
+    changes = OrderedDict()
+    with sqlite3.connect(database) as connection:
+        for table in tables:
+            condition = replace[table]
+            deleted = connection.execute('DELETE FROM %s WHERE %s' % (table, condition),
+                                         (semester,) if '?' in condition else ()).rowcount
+            changes[table] = deleted
+        # anything with a larger rowid than this was inserted by `load` below
+        last = {table: connection.execute('SELECT COALESCE(MAX(rowid), 0) FROM ' + table)
+                                 .fetchone()[0] for table in tables}
+        next_term = connection.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM term').fetchone()[0]
+        load(connection, catalogs=files['catalogs'], sections=files['sections'],
+             exams=files['exams'], grades=files['grades'], terms=TermTable(start=next_term),
+             stream=stream)
+
+        for table in tables:
+            if table in ('term', 'exam', 'grade'):  # sections are checked through their terms
+                wrong = connection.execute('SELECT DISTINCT semester FROM %s '
+                                           'WHERE rowid > ? AND semester != ?' % table,
+                                           (last[table], semester)).fetchall()
+                if wrong:
+                    # raising rolls back everything, including the DELETEs
+                    raise ValueError("expected only %s in %s, got %s"
+                                     % (semester, files[source[table]],
+                                        ', '.join(str(row[0]) for row in wrong)))
+            inserted = connection.execute('SELECT COUNT(*) FROM %s WHERE rowid > ?' % table,
+                                          (last[table],)).fetchone()[0]
+            changes[table] = changes[table], inserted
+            LOGGER.info("%s: replaced %d rows with %d", table, *changes[table])
+    return changes
@@ -0,0 +1,135 @@
+'''Record the responses downloads get, and play them back without the network.
+
+Every download (get_sections, get_catalog, get_exam, get_grades, get_seats, ...)
+goes through the session in session.py, so swapping its transport adapter is
+enough to capture or replay all of them. Recordings are one directory per request:
+<directory>/<sha256 of method, url and body>/request.json, response.json and body.
+
+Replaying sleeps `latency` seconds per request, without holding any lock, so
+concurrent downloads and the cache can be load tested offline against
+something about as slow as the real server.'''
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from io import BytesIO
+from logging import getLogger
+from os import path
+from time import sleep
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from . import session as _session
+
+LOGGER = getLogger(__name__)
+
+
+def _body(request):
+    '''INTERNAL DO NOT USE'''
+    body = request.body or ''
+    return body.decode('latin-1') if isinstance(body, bytes) else body
+
+
+def recording_key(request):
+    '''Return the name of the recording for a requests.PreparedRequest'''
+    key = json.dumps([request.method.upper(), request.url, _body(request)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def save(directory, request, response):
+    '''Record `response` as the answer to `request`, reading the whole body'''
+    entry = path.join(directory, recording_key(request))
+    tmp = '%s.%d.%d.tmp' % (entry, os.getpid(), threading.get_ident())
+    os.makedirs(tmp, exist_ok=True)
+    with open(path.join(tmp, 'request.json'), 'w') as handle:
+        json.dump({'method': request.method, 'url': request.url, 'body': _body(request)},
+                  handle, indent=1)
+    # the body is saved decoded, so it isn't gzipped or chunked anymore
+    headers = {key: value for key, value in response.headers.items()
+               if key.lower() not in ('content-encoding', 'transfer-encoding')}
+    headers['Content-Length'] = str(len(response.content))
+    with open(path.join(tmp, 'response.json'), 'w') as handle:
+        json.dump({'status': response.status_code, 'reason': response.reason,
+                   'headers': headers}, handle, indent=1)
+    with open(path.join(tmp, 'body'), 'wb') as handle:
+        handle.write(response.content)
+    try:
+        if path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(tmp, entry)
+    except OSError:  # another thread recorded the same request at the same time
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class RecordingAdapter(HTTPAdapter):
+    '''An HTTPAdapter that also records every response it gets to `directory`.
+    The body is read as soon as it arrives, so `stream=True` doesn't stream.'''
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        response = super().send(request, **kwargs)
+        save(self.directory, request, response)
+        LOGGER.debug("recorded %s %s", request.method, request.url)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    '''Answers requests from the recordings in `directory`, after `latency` seconds.
+    A request that wasn't recorded raises requests.ConnectionError,
+    the same as if the server was down.'''
+    def __init__(self, directory, latency=0):
+        super().__init__()
+        self.directory, self.latency = directory, latency
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        # pylint: disable=too-many-arguments
+        entry = path.join(self.directory, recording_key(request))
+        try:
+            with open(path.join(entry, 'response.json')) as handle:
+                meta = json.load(handle)
+            with open(path.join(entry, 'body'), 'rb') as handle:
+                body = handle.read()
+        except OSError:
+            raise requests.ConnectionError('no recording of %s %s in %s'
+                                           % (request.method, request.url, self.directory),
+                                           request=request)
+        if self.latency:
+            sleep(self.latency)
+        response = requests.Response()
+        response.status_code, response.reason = meta['status'], meta['reason']
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = BytesIO(body)
+        response.url, response.request = request.url, request
+        return response
+
+    def close(self):
+        pass
+
+
+def _mount(adapter, session):
+    '''INTERNAL DO NOT USE'''
+    if session is None:
+        session = _session.session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return adapter
+
+
+def record(directory, session=None):
+    '''Record every response `session` (default: the shared one) gets to `directory`'''
+    return _mount(RecordingAdapter(directory, max_retries=_session.make_retry(),
+                                   pool_maxsize=_session.POOL_SIZE), session)
+
+
+def replay(directory, latency=0, session=None):
+    '''Answer every request `session` (default: the shared one) sends
+    from the recordings in `directory`, instead of the network'''
+    return _mount(ReplayAdapter(directory, latency), session)
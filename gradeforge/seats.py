@@ -0,0 +1,80 @@
+'''Keep the number of open seats in each section up to date.
+
+Seats change all through registration, so they aren't part of the sections
+page (and the `section` table); each section has its own detail page with them,
+which `parse.get_seats` reads. This fetches those pages for many sections at
+once with a rate limit, and stores the result in the `seats` table with the time
+it was fetched, so sections refreshed recently enough can be skipped.'''
+
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import getLogger
+from time import time
+
+from .mirror import TokenBucket
+from .parse import get_seats
+from .sql import TABLES, QUERIES, insert_command
+from .utils import DEFAULT_DATABASE, section_link
+
+LOGGER = getLogger(__name__)
+
+# seconds a refresh is good for
+TTL = 15 * 60
+# pages at once, and pages per second
+WORKERS = 4
+RATE = 2
+# rows written between commits, so an interrupted refresh keeps most of its work
+COMMIT_EVERY = 100
+
+COLUMNS = ('semester', 'uid', 'capacity', 'taken', 'remaining', 'fetched')
+
+
+def stale(connection, semester, uids, ttl=TTL):
+    '''Return the uids in `uids` which weren't refreshed in the last `ttl` seconds'''
+    fresh = {str(uid) for uid, in connection.execute(
+        'SELECT uid FROM seats WHERE semester = ? AND fetched > ?', (semester, time() - ttl))}
+    return [uid for uid in uids if str(uid) not in fresh]
+
+
+def _fetch(bucket, fetch, semester, uid):
+    '''INTERNAL DO NOT USE'''
+    bucket.acquire()
+    capacity, taken, remaining = map(int, fetch(section_link(semester, uid)))
+    return capacity, taken, remaining, time()
+
+
+def refresh_seats(semester, uids=None, database=DEFAULT_DATABASE, ttl=TTL,
+                  workers=WORKERS, rate=RATE, fetch=get_seats):
+    '''Fetch the seats of every section in `uids` (CRNs; default every section in
+    `semester`), `workers` at a time and at most `rate` per second, and store them
+    in the `seats` table. Sections refreshed in the last `ttl` seconds are skipped.
+    fetch: function taking a section's link and returning (capacity, taken, remaining)
+    Returns a Counter of 'refreshed', 'fresh' and 'failed'.'''
+    semester = str(semester)
+    results = Counter()
+    with sqlite3.connect(database) as connection:
+        # databases built before the table existed don't have it
+        connection.execute('CREATE TABLE IF NOT EXISTS seats(%s)' % ', '.join(TABLES['seats']))
+        if uids is None:
+            uids = [uid for uid, in connection.execute(QUERIES['semester_uids'], (semester,))]
+        todo = stale(connection, semester, uids, ttl)
+        results['fresh'] = len(uids) - len(todo)
+        command = insert_command('seats', COLUMNS, conflict='REPLACE')
+        bucket = TokenBucket(rate)
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {pool.submit(_fetch, bucket, fetch, semester, uid): uid for uid in todo}
+            # sqlite connections belong to one thread, so this one does all the writing
+            for future in as_completed(futures):
+                uid = futures[future]
+                try:
+                    seats = future.result()
+                except Exception as e:  # pylint: disable=broad-except
+                    LOGGER.warning("seats for %s %s: %s", semester, uid, e)
+                    results['failed'] += 1
+                    continue
+                connection.execute(command, (semester, uid) + seats)
+                results['refreshed'] += 1
+                if not results['refreshed'] % COMMIT_EVERY:
+                    connection.commit()
+    return results
@@ -0,0 +1,90 @@
+'''The HTTP session every download goes through.
+
+Calling `requests.get` directly opens a new TLS connection for every page and
+gives up the first time the school's server hiccups. This keeps connections
+alive between requests, retries transient failures with exponential backoff,
+and gives every request a timeout so a hung server can't hang `make` forever.'''
+
+from logging import getLogger
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import cached_request
+
+LOGGER = getLogger(__name__)
+
+# (connect, read) in seconds. the oracle server can take minutes to send every section
+TIMEOUT = (10, 300)
+RETRIES = 5
+# a read timeout means the server is already stuck on a slow request, so only try
+# once more; otherwise one hung request could wait RETRIES * TIMEOUT[1] (25 minutes)
+READ_RETRIES = 1
+# seconds; waits 0, 2, 4, 8, ... between retries. Retry-After headers take precedence
+BACKOFF = 1
+# responses worth trying again. anything else (like a 404) is returned as-is
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# connections kept open per host; should be at least as many as concurrent downloads
+POOL_SIZE = 8
+
+# when set, responses are cached in this directory; see cache.cached_request.
+# `gradeforge download --cache` sets it
+CACHE_DIR = None
+
+_SESSION = None
+
+
+def make_retry(retries=RETRIES, backoff=BACKOFF):
+    '''Return a urllib3 Retry. Every request we make only reads data
+    (the POSTs are search forms), so it's safe to retry POSTs too.
+    At worst a request takes about (READ_RETRIES + 1) * TIMEOUT[1] seconds before failing.'''
+    kwargs = dict(total=retries, read=min(retries, READ_RETRIES), backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUS, raise_on_status=False,
+                  respect_retry_after_header=True)
+    methods = frozenset(('GET', 'POST', 'HEAD'))
+    try:
+        return Retry(allowed_methods=methods, **kwargs)
+    except TypeError:  # urllib3 < 1.26
+        return Retry(method_whitelist=methods, **kwargs)
+
+
+def make_session(retries=RETRIES, backoff=BACKOFF, pool_size=POOL_SIZE):
+    '''Return a new requests.Session with retries and connection pooling'''
+    new_session = requests.Session()
+    adapter = HTTPAdapter(max_retries=make_retry(retries, backoff),
+                          pool_connections=pool_size, pool_maxsize=pool_size)
+    new_session.mount('https://', adapter)
+    new_session.mount('http://', adapter)
+    return new_session
+
+
+def session():
+    '''Return the session shared by the whole process, creating it if needed.
+    The connection pool is thread safe, so downloads in different threads can share it.'''
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = make_session()
+    return _SESSION
+
+
+def request(method, url, immutable=False, **kwargs):
+    '''Same as `requests.request`, but through the shared session and with
+    TIMEOUT unless a timeout is given.
+    immutable: the response will never change, so if CACHE_DIR is set and it
+               has been cached before, it doesn't need to be requested again'''
+    kwargs.setdefault('timeout', TIMEOUT)
+    LOGGER.debug("%s %s", method, url)
+    if CACHE_DIR is not None:
+        return cached_request(session(), method, url, CACHE_DIR, immutable, **kwargs)
+    return session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    '''Same as `requests.get`; see `request`'''
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    '''Same as `requests.post`; see `request`'''
+    return request('POST', url, data=data, **kwargs)
@@ -8,11 +8,22 @@ TODO:
 - ask brady if we care about registration start
 '''
 
+import os
 import sqlite3
 import csv
+import threading
+import weakref
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from logging import getLogger
+from os import path
+from time import perf_counter
+from urllib.request import pathname2url
 
 from .utils import DEFAULT_DATABASE
 
+LOGGER = getLogger(__name__)
+
 TABLES = {'class': ["title tinytext NOT NULL",
                     "department char(4) NOT NULL",
                     "code varchar(4) NOT NULL",
@@ -63,8 +74,15 @@ TABLES = {'class': ["title tinytext NOT NULL",
                       "primary_instructor tinytext NOT NULL",
                       'secondary_instructors tinytext',
                       "finalExam dateTime"],
-                      # always out of date; requires parsing different page
-                      #"capacity tinyint", "remaining tinyint"
+          # always out of date, so kept apart from section; see seats.refresh_seats
+          'seats': ["semester char(6) NOT NULL",
+                    "uid tinyint(5) NOT NULL",
+                    "capacity smallint NOT NULL",
+                    "taken smallint NOT NULL",
+                    "remaining smallint NOT NULL",
+                    # seconds since the epoch
+                    "fetched real NOT NULL",
+                    "PRIMARY KEY (semester, uid)"],
           'grade': ['semester char(6)',
                     'department char(4)',
                     'code varchar(5)',
@@ -105,6 +123,105 @@ TABLES = {'class': ["title tinytext NOT NULL",
          }
 
 
+# name: 'table(columns)'. these are only created after the data is loaded,
+# since updating an index on every insert is much slower than building it once
+INDEXES = {'section_course': 'section(department, code, section)',
+           'section_term': 'section(term)',
+           'term_semester': 'term(semester)',
+           'class_course': 'class(department, code)',
+           'grade_course': 'grade(department, code, section, semester)'}
+
+# the queries gradeforge runs itself; INDEXES is chosen to cover these.
+# `gradeforge sql explain` shows the plan sqlite picks for each one
+QUERIES = {'section_info': '''
+               SELECT uid, primary_instructor, title
+               FROM section INNER JOIN class
+                               ON class.department = section.department
+                               AND class.code = section.code
+                            INNER JOIN term
+                               ON term.id = section.term
+               WHERE class.department = ?
+                     AND class.code = ?
+                     AND section = ?
+                     AND semester = ?''',
+           # NOTE: we can't use prepared statements for column names
+           'section_grades': '''
+               SELECT A, "B+", B, "C+", C, "D+", D, F, INCOMPLETE, W, WF
+               FROM grade WHERE department = ?
+                                AND code = ?
+                                AND section = ?
+                                AND semester = ?''',
+           'semester_sections': '''
+               SELECT department, code, section
+               FROM section INNER JOIN term ON term = term.id
+               WHERE semester = ?''',
+           'semester_uids': '''
+               SELECT uid
+               FROM section INNER JOIN term ON term = term.id
+               WHERE semester = ?'''}
+
+
+def insert_command(table, headers, conflict=None):
+    '''Return a parameterized INSERT statement for `headers` (column names) of `table`.
+    conflict: what to do when a row violates a constraint, for example IGNORE'''
+    command = 'INSERT %sINTO %s (%s) VALUES (%s)'
+    return command % ('OR %s ' % conflict if conflict else '', table,
+                      ', '.join(map(repr, headers)), ', '.join('?' * len(headers)))
+
+
+def create_tables(connection):
+    '''Create every table in TABLES'''
+    command = ''.join('CREATE TABLE %s(%s);' % (key, ', '.join(value))
+                      for key, value in TABLES.items())
+    connection.executescript(command)
+
+
+def create_indexes(connection):
+    '''Create every index in INDEXES that doesn't exist yet, then ANALYZE so the
+    query planner knows how selective they are'''
+    for name, definition in INDEXES.items():
+        connection.execute('CREATE INDEX IF NOT EXISTS %s ON %s' % (name, definition))
+    connection.execute('ANALYZE')
+
+
+@contextmanager
+def bulk_load(connection, cache_mb=256):
+    '''Trade durability for speed while loading lots of rows into `connection`.
+    The rollback journal is kept in memory and nothing is fsynced, so a crash
+    partway through can leave a corrupt database. Only use this on a database
+    that would be thrown away and rebuilt in that case, like the makefile does.
+    The pragmas are put back the way they were afterwards, e.g. a database in WAL mode stays in it.'''
+    connection.commit()  # pragmas can't change journal mode inside a transaction
+    original = {pragma: connection.execute('PRAGMA %s' % pragma).fetchone()[0]
+                for pragma in ('journal_mode', 'synchronous', 'cache_size')}
+    connection.execute('PRAGMA journal_mode = MEMORY')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute('PRAGMA cache_size = -%d' % (cache_mb * 1024))  # negative means KiB
+    try:
+        yield connection
+    except:
+        connection.rollback()  # the journal is in memory, but still there
+        raise
+    else:
+        connection.commit()
+    finally:
+        for pragma, value in original.items():
+            connection.execute('PRAGMA %s = %s' % (pragma, value))
+
+
+def explain(database=DEFAULT_DATABASE, queries=None):
+    '''Return {name: [steps of the query plan]} for every query in `queries`
+    (default QUERIES), as reported by EXPLAIN QUERY PLAN'''
+    plans = OrderedDict()
+    with sqlite3.connect(database) as connection:
+        for name, sql_query in sorted((queries or QUERIES).items()):
+            # the plan doesn't depend on the parameters, only that there are some
+            rows = connection.execute('EXPLAIN QUERY PLAN ' + sql_query,
+                                      ('',) * sql_query.count('?'))
+            plans[name] = [row[-1] for row in rows]
+    return plans
+
+
 def csv_insert(table, csv_file, cursor):
     '''Given a table and the corresponding CSV file, plop the whole thing into a database
     TODO: accept file descriptor for csv_file'''
@@ -113,32 +230,136 @@ def csv_insert(table, csv_file, cursor):
         reader = csv.reader(f)
         # TODO: check if this matches table
         try:
-            headers = tuple(map(lambda s: repr(s.strip()), next(reader)))
+            headers = tuple(map(str.strip, next(reader)))
         except StopIteration as e:
             raise ValueError("FATAL: csv file '%s' exists but is empty. Is there a makefile problem?" % csv_file) from e
-        command = 'INSERT INTO %s (%s) VALUES (%s)'
-        command %= table, ', '.join(headers), ', '.join('?' * len(headers))
-        cursor.executemany(command, reader)
+        cursor.executemany(insert_command(table, headers), reader)
 
 
 def create(catalog='catalog.csv', departments='departments.csv',
            instructors='instructors.csv', terms='terms.csv',
            sections='sections.csv', grades='grades.csv',
-           exams='exams.csv', database=DEFAULT_DATABASE):
+           exams='exams.csv', database=DEFAULT_DATABASE, bulk=False):
     '''main create function for the gradeforge project. for every table in
-    TABLES, create it in the database and add the corresponding CSV file.'''
+    TABLES, create it in the database and add the corresponding CSV file.
+    Each table is loaded in its own transaction; indexes are built afterwards.
+
+    bulk: use `bulk_load` while inserting. much faster, but see its warning.
+
+    Returns {table: seconds taken}, plus entries for 'indexes' and 'total'.'''
+    timings = OrderedDict()
+    start = perf_counter()
     with sqlite3.connect(database) as connection:
-        command = ''.join('CREATE TABLE %s(%s);' % (key, ', '.join(value))
-                          for key, value in TABLES.items())
-        connection.executescript(command)
+        create_tables(connection)
+        with bulk_load(connection) if bulk else connection:
+            for table, csv_file in (('class', catalog), ('department', departments),
+                                    ('instructor', instructors), ('term', terms),
+                                    ('section', sections), ('grade', grades),
+                                    ('exam', exams)):
+                table_start = perf_counter()
+                csv_insert(table, csv_file, connection)
+                connection.commit()
+                timings[table] = perf_counter() - table_start
+                LOGGER.info("loaded %s from %s in %.2fs", table, csv_file, timings[table])
+            index_start = perf_counter()
+            create_indexes(connection)
+            timings['indexes'] = perf_counter() - index_start
+    timings['total'] = perf_counter() - start
+    return timings
 
-        csv_insert('class', catalog, connection)
-        csv_insert('department', departments, connection)
-        csv_insert('instructor', instructors, connection)
-        csv_insert('term', terms, connection)
-        csv_insert('section', sections, connection)
-        csv_insert('grade', grades, connection)
-        csv_insert('exam', exams, connection)
+
+class _Lease:
+    '''INTERNAL DO NOT USE
+    one thread's connection to one database. When the thread exits and its
+    thread-local data is freed, the connection goes back to `idle` for the next thread.'''
+    def __init__(self, identity, connection, idle):
+        self.identity, self.connection = identity, connection
+        self._finalizer = weakref.finalize(self, idle.append, (identity, connection))
+
+    def close(self):
+        self._finalizer.detach()
+        self.connection.close()
+
+
+class ConnectionPool:
+    '''Read-only connections to sqlite databases, reused across calls instead of
+    paying for `sqlite3.connect` and parsing the schema every time.
+    Each thread gets its own connection; connections of threads that have exited
+    are handed to new threads, since some servers start a thread per request.
+
+    A connection is reopened when its database file is replaced, for example
+    by `make sql`; changes made to the same file are seen without reopening.
+
+    immutable: serve a database nothing writes to. sqlite skips locking and
+               change detection, and the whole file is memory mapped, so pages
+               already in the OS page cache are read without a syscall.
+               Connections are also reopened when the file's size or mtime changes,
+               but a query that runs while the file is being written can see garbage.'''
+    def __init__(self, immutable=False):
+        self.immutable = immutable
+        self.local = threading.local()
+        self.idle = defaultdict(deque)  # database: deque of (identity, connection)
+
+    def get(self, database=DEFAULT_DATABASE):
+        '''Return this thread's connection to `database`, opening it if needed'''
+        database = path.abspath(database)
+        leases = self.local.__dict__.setdefault('leases', {})
+        try:
+            # an open connection keeps its file's inode alive, so a replacement can't reuse it
+            stat = os.stat(database)
+            identity = stat.st_dev, stat.st_ino
+            if self.immutable:
+                identity += stat.st_size, stat.st_mtime_ns
+        except OSError:
+            identity = None  # let sqlite give the error
+        lease = leases.get(database)
+        if lease is not None:
+            if lease.identity == identity:
+                return lease.connection
+            LOGGER.debug("%s was replaced, reopening", database)
+            lease.close()
+
+        idle = self.idle[database]
+        while True:
+            try:
+                old_identity, connection = idle.popleft()
+            except IndexError:
+                connection = self._open(database, identity)
+                break
+            if old_identity == identity:
+                break
+            connection.close()
+        leases[database] = _Lease(identity, connection, idle)
+        return connection
+
+    def _open(self, database, identity):
+        '''INTERNAL DO NOT USE'''
+        uri = 'file:%s?mode=ro' % pathname2url(database)
+        if self.immutable:
+            uri += '&immutable=1'
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if self.immutable and identity is not None:
+            # sqlite silently caps this at its compile-time maximum, 2 GB by default
+            connection.execute('PRAGMA mmap_size = %d' % identity[2])
+        return connection
+
+    def close(self):
+        '''Close every connection this thread has open, and every idle connection'''
+        for lease in self.local.__dict__.pop('leases', {}).values():
+            lease.close()
+        for idle in self.idle.values():
+            while idle:
+                idle.popleft()[1].close()
+
+
+POOL = ConnectionPool()
+IMMUTABLE_POOL = ConnectionPool(immutable=True)
+
+
+def connect(database=DEFAULT_DATABASE, immutable=False):
+    '''Return a read-only connection to `database` from POOL, or IMMUTABLE_POOL
+    if `immutable` is set. Don't close it; it will be reused by the next call in this thread.'''
+    return (IMMUTABLE_POOL if immutable else POOL).get(database)
 
 
 def limited_query(database=DEFAULT_DATABASE, table='section', columns='*', **filters):
@@ -149,17 +370,21 @@ def limited_query(database=DEFAULT_DATABASE, table='section', columns='*', **fil
                                  for key, value in filters.items()])
     command = 'SELECT %s FROM %s%s;' % (', '.join(columns), table,
                                         ' WHERE ' + query_filter if query_filter != '' else '')
-    with sqlite3.connect(database) as connection:
-        return connection.execute(command).fetchall()
+    return connect(database).execute(command).fetchall()
 
 
-def query(sql_query, database=DEFAULT_DATABASE):
-    '''Return the result of an sql query exactly as if it had been passed to the sqlite3 binary'''
-    with sqlite3.connect(database) as connection:
-        return '\n'.join('|'.join(map(str, t))
-                         for t in connection.execute(sql_query).fetchall())
+def query(sql_query, database=DEFAULT_DATABASE, write=False, immutable=False):
+    '''Return the result of an sql query exactly as if it had been passed to the sqlite3 binary.
+    The query runs on a read-only connection unless `write` is set.
+    immutable: see ConnectionPool'''
+    if write:
+        with sqlite3.connect(database) as connection:
+            rows = connection.execute(sql_query).fetchall()
+    else:
+        rows = connect(database, immutable).execute(sql_query).fetchall()
+    return '\n'.join('|'.join(map(str, t)) for t in rows)
 
 
 def dump(database=DEFAULT_DATABASE):
     '''Dump the whole database. Assumes the database was created by GradeForge.'''
-    print('\n'.join(query("SELECT * FROM " + table) for table in TABLES))
+    return '\n'.join(query("SELECT * FROM " + table, database) for table in TABLES)
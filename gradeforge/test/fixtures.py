@@ -0,0 +1,165 @@
+'''Synthetic versions of the pages we download, for tests and benchmarks.
+These only have as much structure as the parsers look at.'''
+
+import zipfile
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+SECTION_HEADER = '''<html><head><title>Class Schedule Listing</title></head>
+<body>
+<table class="datadisplaytable" summary="This layout table is used to present the sections found" width="100%">
+<caption class="captiontext">Sections Found</caption>
+<tr><th class="ddheader">Title</th></tr>
+<tr><td class="dddefault">&nbsp;</td></tr>
+'''
+
+SECTION = '''<tr>
+<th class="ddtitle"><a href="/BANP/bwckschd.p_disp_detail_sched?term_in={semester}&amp;crn_in={uid}">Intro to Computer Science - {uid} - {department} {code} - {section}</a></th>
+</tr>
+<tr>
+<td class="dddefault">
+<span class="fieldlabeltext">Associated Term: </span>{season} {year}
+<br/>
+<span class="fieldlabeltext">Registration Dates: </span>Mar 26, {year} to Aug 29, {year}
+<br/>
+<span class="fieldlabeltext">Levels: </span>Undergraduate
+<br/>
+USC {campus} Campus
+<br/>
+Lecture Schedule Type
+<br/>
+Traditional Instructional Method
+<br/>
+3.000 Credits
+<br/>
+<table class="datadisplaytable" summary="This table lists the scheduled meeting times and assigned instructors for this class..">
+<tr><th class="ddheader">Type</th></tr>
+<tr>
+<td class="dddefault">Class</td>
+<td class="dddefault">{start} - {end}</td>
+<td class="dddefault">MWF</td>
+<td class="dddefault">SWGN 2A27</td>
+<td class="dddefault">Aug 23, {year} - {end_date}</td>
+<td class="dddefault">Lecture</td>
+<td class="dddefault">{instructor} (<abbr title="Primary">P</abbr>)<a href="mailto:{email}" target="{instructor}">E-mail</a></td>
+</tr>
+</table>
+</td>
+</tr>
+'''
+
+SECTION_FOOTER = '''</table>
+<table class="datadisplaytable"><tr><td>unrelated</td></tr></table>
+</body></html>
+'''
+
+TIMES = (('8:30 am', '9:20 am'), ('10:50 am', '11:40 am'), ('1:10 pm', '2:00 pm'),
+         ('2:20 pm', '3:10 pm'), ('6:00 pm', '8:30 pm'))
+
+
+def sections_html(count=10, season='Fall', year=2018, terms=3, department='CSCE'):
+    '''Return a sections page with `count` sections spread over `terms` distinct terms'''
+    semester = {'Fall': '08', 'Spring': '01', 'Summer': '05'}[season]
+    last_day = date(year, 12, 10)
+    rows = []
+    for i in range(count):
+        start, end = TIMES[i % len(TIMES)]
+        rows.append(SECTION.format(semester=str(year) + semester, uid=10000 + i,
+                                   department=department, code=100 + i % 700,
+                                   section=str(i % 30).zfill(3), season=season,
+                                   year=year, campus='Columbia', start=start, end=end,
+                                   end_date=(last_day + timedelta(i % terms)).strftime('%b %d, %Y'),
+                                   instructor='Instructor %d' % (i % 50),
+                                   email='instructor%d@sc.edu' % (i % 50)))
+    return SECTION_HEADER + ''.join(rows) + SECTION_FOOTER
+
+CATALOG_HEADER = '''<html><head><title>Catalog Entries</title></head>
+<body>
+<table class="datadisplaytable" summary="This table lists all course detail for the selected term." width="100%">
+'''
+
+COURSE = '''<tr><td class="nttitle"><a href="/BANP/bwckctlg.p_disp_course_detail?cat_term_in={semester}&amp;subj_code_in={department}&amp;crse_numb_in={code}">{department} {code} - Course {code}</a></td></tr>
+<tr><td class="ntdefault">Description of course {code}.<br/>3.000 Credit hours<br/><span class="fieldlabeltext">Levels: </span>Undergraduate<br/><span class="fieldlabeltext">Schedule Types: </span>Lecture<br/>{description} Department<br/><a href="/BANP/bwckctlg.p_disp_listcrse?term_in={semester}&amp;subj_in={department}&amp;crse_in={code}">All Sections for this Course</a></td></tr>
+'''
+
+CATALOG_FOOTER = '''</table>
+</body></html>
+'''
+
+
+def catalog_html(count=10, department='CSCE', description='Computer Science', semester='201808'):
+    '''Return a catalog page with `count` courses, all in `department`'''
+    return CATALOG_HEADER + ''.join(COURSE.format(semester=semester, department=department,
+                                                  code=100 + i, description=description)
+                                    for i in range(count)) + CATALOG_FOOTER
+
+
+XLSX_FILES = {
+    '[Content_Types].xml': '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>',
+    'xl/workbook.xml': '''<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>''',
+    'xl/_rels/workbook.xml.rels': '''<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''}
+
+# the header of the grade spreads from fall 2013 on, before any renaming.
+# NoGrade has no space, so the renaming has to add one
+XLSX_GRADE_HEADERS = ('SUBJECT,COURSE_NUMBER,COURSE_SECTION,TITLE,A,B+,B,C+,C,D+,D,F,'
+                      'A_GF,B+_GF,B_GF,C_GF,C+_GF,D+_GF,D_GF,F_GF,'
+                      'S,U,UN,Incomplete,W,WF,NR,Num Grades Posted,NoGrade,T,IP,FN,AUDIT').split(',')
+
+
+def _cell(column, row, value, strings):
+    '''numbers are stored as floats, text once in the shared strings.
+    Example: _cell(27, 3, 'x', {}) -> '<c r="AB3" t="s"><v>0</v></c>' '''
+    reference = ''
+    column += 1
+    while column:
+        column, letter = divmod(column - 1, 26)
+        reference = chr(ord('A') + letter) + reference
+    if isinstance(value, (int, float)):
+        return '<c r="%s%d"><v>%r</v></c>' % (reference, row, float(value))
+    strings.setdefault(value, len(strings))
+    return '<c r="%s%d" t="s"><v>%d</v></c>' % (reference, row, strings[value])
+
+
+def write_xlsx(file_name, rows):
+    '''Write a workbook with a single sheet holding `rows` to `file_name`.
+    None leaves a cell out, the way spreadsheets do for empty cells.'''
+    strings, sheet = {}, []
+    for i, row in enumerate(rows, 1):
+        sheet.append('<row r="%d">%s</row>' % (i, ''.join(
+            _cell(j, i, value, strings) for j, value in enumerate(row) if value is not None)))
+    namespace = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    with zipfile.ZipFile(file_name, 'w') as archive:
+        for name, contents in XLSX_FILES.items():
+            archive.writestr(name, contents)
+        archive.writestr('xl/sharedStrings.xml', '<sst xmlns="%s">%s</sst>' % (
+            namespace, ''.join('<si><t>%s</t></si>' % escape(string) for string in strings)))
+        archive.writestr('xl/worksheets/sheet1.xml', '<worksheet xmlns="%s"><sheetData>%s'
+                         '</sheetData></worksheet>' % (namespace, ''.join(sheet)))
+
+
+def grades_xlsx(file_name, count=10, department='CSCE'):
+    '''Write a new style grade spread with `count` sections to `file_name`'''
+    write_xlsx(file_name, [XLSX_GRADE_HEADERS] + [
+        [department, str(100 + i), '%03d' % i, 'Course %d' % i] + [i % 7] * 8 + [None] * 8
+        + [None] * 7 + [i % 7 * 8] + [None] * 5 for i in range(count)])
+
+
+GRADES_TITLE = '          UNIVERSITY OF SOUTH CAROLINA - {campus}: GRADE SPREAD FOR {season} {year}\n'
+GRADES_COLUMNS = ('DEPT  CRSE#  SECT   A   B+    B   C+    C   D+    D    F    S    U    W   WF'
+                  '    I   NR  AUD  TOTAL\n')
+
+
+def grades_text(count=100, campus='AIKEN', season='FALL', year=2012, per_page=50):
+    '''Return what `pdftotext -layout` makes of an old (pdf) grade spread with `count`
+    sections, `per_page` to a page. Pages after the first only have a page number.'''
+    pages = []
+    for start in range(0, count, per_page):
+        lines = ['%-5s %5d  %4s ' % ('CSCE', 100 + i % 700, '%03d' % (i % 30))
+                 + ''.join('%5d' % ((i + j) % 9) for j in range(15)) + '%7d\n' % (i % 9 * 15)
+                 for i in range(start, min(start + per_page, count))]
+        pages.append(''.join(lines) + '\n%60s\n' % ('Page %d' % (len(pages) + 1)))
+    return (GRADES_TITLE.format(campus=campus, season=season, year=year) + '\n'
+            + GRADES_COLUMNS + '\n' + '\f'.join(pages))
@@ -0,0 +1,72 @@
+'''Unit tests for gradeforge.books'''
+
+import re
+from os import path
+
+from selenium.common.exceptions import NoSuchElementException
+
+from gradeforge.books import download_books, book_path, read_checkpoint
+
+
+class FakeDriver:
+    '''Enough of a selenium driver for get_bookstore, without a browser.
+    `flaky` sections fail to load the first time they're asked for;
+    `empty` sections have no books'''
+    def __init__(self, flaky=(), empty=()):
+        self.flaky, self.empty = set(flaky), set(empty)
+        self.page_source = ''
+        self.quit_called = False
+
+    def execute_script(self, js):
+        department, code, section = re.search(r"dept=\\'(\w+)\\' num=\\'(\w+)\\' sect=\\'(\w+)\\'",
+                                              js).groups()
+        self.page_source = '<html>%s %s %s</html>' % (department, code, section)
+
+    def find_element_by_id(self, _):
+        section = tuple(self.page_source[6:-7].split())
+        if section in self.flaky:
+            self.flaky.remove(section)
+            raise NoSuchElementException('not loaded yet')
+        if section in self.empty:
+            self.page_source = 'COURSE MATERIALS SELECTION PENDING'
+            raise NoSuchElementException('no books')
+
+    def quit(self):
+        self.quit_called = True
+
+
+SECTIONS = [('CSCE', '145', '001'), ('CSCE', '146', '001'), ('MATH', '141', '002'),
+            ('ENGL', '101', '010'), ('HIST', '111', '001')]
+
+
+def test_download_books(tmpdir):
+    directory = str(tmpdir)
+    drivers = []
+    def factory():
+        drivers.append(FakeDriver(flaky=[SECTIONS[1]], empty=[SECTIONS[2]]))
+        return drivers[-1]
+
+    results = download_books(SECTIONS, '201808', directory, drivers=2, rate=1000,
+                             backoff=0, driver_factory=factory, http=False)
+    assert results == {'downloaded': 4, 'unavailable': 1}
+    assert 1 <= len(drivers) <= 2 and all(driver.quit_called for driver in drivers)
+    with open(book_path(directory, '201808', *SECTIONS[0])) as readable:
+        assert readable.read() == '<html>CSCE 145 001</html>'
+    assert not path.exists(book_path(directory, '201808', *SECTIONS[2]))
+    assert read_checkpoint(str(tmpdir.join('201808.done'))) == set(SECTIONS)
+
+    # everything is checkpointed, so a second run doesn't start a browser
+    results = download_books(SECTIONS, '201808', directory, driver_factory=None)
+    assert results == {'skipped': 5}
+
+
+def test_download_books_failed(tmpdir):
+    class Broken(FakeDriver):
+        def execute_script(self, js):
+            raise NoSuchElementException('never loads')
+
+    results = download_books(SECTIONS[:2], '201808', str(tmpdir), drivers=1, rate=1000,
+                             retries=2, backoff=0, driver_factory=Broken, http=False)
+    assert results == {'failed': 2}
+    # failures aren't checkpointed, so they're tried again next time
+    assert read_checkpoint(str(tmpdir.join('201808.done'))) == set()
@@ -0,0 +1,104 @@
+'''Unit tests for gradeforge.cache'''
+
+import os
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gradeforge import download, session
+from gradeforge.cache import cached_parse, cached_request, describe, stats, prune
+from gradeforge.session import make_session
+
+
+def copy(file_name, output):
+    'a stand-in parse function that counts its calls'
+    copy.calls += 1
+    with open(file_name) as readable, open(output, 'w') as writable:
+        writable.write(readable.read().upper())
+copy.calls = 0
+
+
+def test_cached_parse(tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    first, second = str(tmpdir.join('first.html')), str(tmpdir.join('second.html'))
+    for name in first, second:
+        with open(name, 'w') as handle:
+            handle.write('same contents')
+    output = str(tmpdir.join('out.csv'))
+
+    assert not cached_parse(copy, first, {'output': output}, cache_dir=cache_dir)
+    os.unlink(output)
+    # a different file with the same bytes is still a hit
+    assert cached_parse(copy, second, {'output': output}, cache_dir=cache_dir)
+    assert copy.calls == 1
+    with open(output) as handle:
+        assert handle.read() == 'SAME CONTENTS'
+
+    info = stats(cache_dir)
+    assert info['entries'] == 1 and info['bytes'] == len('SAME CONTENTS')
+    assert prune(cache_dir, max_age=3600) == (0, 0)
+    assert prune(cache_dir, max_bytes=0) == (1, len('SAME CONTENTS'))
+    assert stats(cache_dir)['entries'] == 0
+
+
+class Versioned(BaseHTTPRequestHandler):
+    'serves a page with an ETag, and answers 304 if the client has it'
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_GET(self):
+        Versioned.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = 'final exams: dec 10'.encode()
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Versioned)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:%d/exams' % httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_cached_request(tmpdir, server):
+    cache_dir, session = str(tmpdir.join('http')), make_session()
+    Versioned.requests = []
+    for _ in range(2):
+        response = cached_request(session, 'GET', server, cache_dir, timeout=5)
+        assert response.status_code == 200 and response.text == 'final exams: dec 10'
+    # the second request was conditional and got a 304
+    assert Versioned.requests == [None, '"v1"']
+
+    cached_request(session, 'GET', server, cache_dir, immutable=True, timeout=5)
+    assert cached_request(session, 'GET', server, cache_dir, timeout=5).text == 'final exams: dec 10'
+    # once it's immutable, the server isn't asked again
+    assert len(Versioned.requests) == 3
+    [(_, _, _, description)] = describe(cache_dir)
+    assert description == 'GET %s (immutable)' % server
+
+
+def test_cached_download_to_file(tmpdir, server, monkeypatch):
+    monkeypatch.setattr(session, 'CACHE_DIR', str(tmpdir.join('http')))
+    Versioned.requests = []
+    # from the network, then a 304, then immutable without asking the server
+    for immutable in False, False, True, True:
+        output = BytesIO()
+        download._request('GET', server, output, immutable=immutable)
+        assert output.getvalue() == b'final exams: dec 10'
+    assert Versioned.requests == [None, '"v1"', '"v1"']
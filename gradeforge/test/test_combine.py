@@ -0,0 +1,72 @@
+'''Unit tests for gradeforge.combine'''
+
+import csv
+import os
+from io import StringIO
+
+from gradeforge.combine import combine_grades, combine_instructors, combine_terms
+from gradeforge.parse import parse_sections
+from gradeforge.test.fixtures import grades_xlsx, sections_html
+
+
+def read_csv(handle):
+    'Return the rows written to the StringIO `handle` as dicts'
+    return list(csv.DictReader(StringIO(handle.getvalue())))
+
+
+def test_combine_terms(tmpdir):
+    inputs = []
+    # the last file has the same terms as the first, so they should be shared
+    for name, season, terms in (('Fall-2018', 'Fall', 3), ('Spring-2018', 'Spring', 2),
+                                ('Copy-2018', 'Fall', 3)):
+        base = str(tmpdir.join(name))
+        with open(base + '.html', 'w') as handle:
+            handle.write(sections_html(10, season=season, terms=terms))
+        parse_sections(base + '.html', instructor_output=base + '.instructors.csv',
+                       term_output=base + '.terms.csv', section_output=base + '.csv')
+        inputs.append(base + '.terms.csv')
+    modified = {name: os.stat(str(tmpdir.join(name))).st_mtime_ns
+                for name in os.listdir(str(tmpdir))}
+
+    terms, sections = StringIO(), StringIO()
+    combine_terms(inputs, terms, sections)
+    terms, sections = read_csv(terms), read_csv(sections)
+    assert [term['id'] for term in terms] == [str(i) for i in range(5)]
+    assert [term['semester'] for term in terms] == ['201808'] * 3 + ['201801'] * 2
+    assert len(sections) == 30
+    by_id = {term['id']: term for term in terms}
+    for section, semester in zip(sections, ['201808'] * 10 + ['201801'] * 10 + ['201808'] * 10):
+        assert by_id[section['term']]['semester'] == semester
+    # the inputs were only read
+    assert {name: os.stat(str(tmpdir.join(name))).st_mtime_ns
+            for name in os.listdir(str(tmpdir))} == modified
+
+
+def test_combine_instructors(tmpdir):
+    files = []
+    for i, rows in enumerate((['Ada,ada@sc.edu', 'Bob,bob@sc.edu'],
+                              # a duplicate, a new one, and a conflicting email
+                              ['Bob,bob@sc.edu', 'Cy,cy@sc.edu', 'Ada,lovelace@sc.edu'])):
+        files.append(str(tmpdir.join('%d.instructors.csv' % i)))
+        with open(files[-1], 'w') as handle:
+            handle.write('name, email\n' + '\n'.join(rows) + '\n')
+    output = StringIO()
+    conflicts = combine_instructors(files, output)
+    assert output.getvalue().splitlines() == ['name, email', 'Ada,ada@sc.edu',
+                                              'Bob,bob@sc.edu', 'Cy,cy@sc.edu']
+    [(name, kept, dropped)] = conflicts
+    assert (name, kept[' email'], dropped[' email']) == ('Ada', 'ada@sc.edu', 'lovelace@sc.edu')
+
+
+def test_combine_grades_xlsx(tmpdir):
+    new, old = str(tmpdir.join('Fall-2014.xlsx')), str(tmpdir.join('Fall-2012-Aiken.csv'))
+    grades_xlsx(new, 5)
+    with open(old, 'w') as handle:
+        handle.write('SEMESTER,CAMPUS,DEPARTMENT,CODE,SECTION,A,TOTAL\n201241,AIKEN,CSCE,101,001,3,3\n')
+    output = str(tmpdir.join('grades.csv'))
+    combine_grades([new, old], output)
+    with open(output) as readable:
+        rows = list(csv.DictReader(readable))
+    assert [(row['SEMESTER'], row['CAMPUS'], row['SECTION']) for row in rows] == \
+        [('201408', '', '%03d' % i) for i in range(5)] + [('201241', 'AIKEN', '001')]
+    assert rows[2]['TOTAL'] == '16' and rows[2]['No Grade'] == ''
@@ -0,0 +1,149 @@
+'''Unit tests for gradeforge.download'''
+
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs
+
+import pytest
+
+from gradeforge import download
+from gradeforge.download import department_shards, merge_sections, sections_form
+from gradeforge.parse import iter_sections, TermTable
+from gradeforge.test.fixtures import sections_html, SECTION_HEADER, SECTION_FOOTER
+
+EMPTY = '<html><body>No classes were found that meet your search criteria</body></html>\n'
+
+
+def departments(page):
+    'Return the department of every section in `page` (bytes)'
+    return [section['department'] for section in iter_sections(BytesIO(page), {}, TermTable())]
+
+
+def test_department_shards():
+    assert department_shards(('ACCT', 'BADM', 'CSCE', 'MATH', 'PHYS'), 2) == \
+        [('ACCT', 'BADM', 'CSCE'), ('MATH', 'PHYS')]
+    assert department_shards(('ACCT', 'BADM'), 8) == [('ACCT',), ('BADM',)]
+
+
+def test_sections_form():
+    assert sections_form(department=('ACCT', 'CSCE'))['SEL_SUBJ'] == ('dummy', ('ACCT', 'CSCE'))
+    with pytest.raises(ValueError):
+        sections_form(department=('ACCT', 'NOPE'))
+
+
+def test_merge_sections(tmpdir):
+    parts = []
+    for i, page in enumerate((EMPTY, sections_html(3, department='ACCT'), EMPTY,
+                              sections_html(2, department='CSCE'))):
+        parts.append(str(tmpdir.join('%d.html' % i)))
+        with open(parts[-1], 'w') as handle:
+            handle.write(page)
+    output = BytesIO()
+    merge_sections(parts, output)
+    assert departments(output.getvalue()) == ['ACCT'] * 3 + ['CSCE'] * 2
+    # the footer, including the unrelated table after the sections, is only there once
+    assert output.getvalue().count(b'unrelated') == 1
+
+    output = BytesIO()
+    merge_sections(parts[:1], output)
+    assert output.getvalue() == EMPTY.encode()
+
+
+class Sections(BaseHTTPRequestHandler):
+    'answers with one section for every department requested'
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        rows = (sections_html(1, department=department)[len(SECTION_HEADER):-len(SECTION_FOOTER)]
+                for department in form['SEL_SUBJ'][1:])
+        body = (SECTION_HEADER + ''.join(rows) + SECTION_FOOTER).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_get_sections_sharded(monkeypatch):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Sections)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(download, 'SECTIONS_URL', 'http://127.0.0.1:%d/' % httpd.server_port)
+    try:
+        output = BytesIO()
+        requested = ('ACCT', 'BADM', 'CSCE', 'MATH', 'PHYS')
+        download.get_sections_sharded(output, shards=3, department=requested,
+                                      semester='201808')
+        assert departments(output.getvalue()) == list(requested)
+
+        # the same page without shards, streamed instead of returned
+        output = BytesIO()
+        assert download.get_sections(output, department=requested, semester='201808') is None
+        assert departments(output.getvalue()) == list(requested)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+class Bookstore(BaseHTTPRequestHandler):
+    '''lists every course asked for, unless one of them is in CHALLENGE
+    (answers with javascript) or has no books (PEND)'''
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        assert form['storeId'] == [download.BOOKSTORE_ID]
+        courses = re.findall(r'<course dept="(\w+)" num="(\w+)" sect="(\w+)" term="F18" />',
+                             form['courseXml'][0])
+        if any(course[0] == 'CHALLENGE' for course in courses):
+            body = '<html><script>eval(atob("..."))</script></html>'
+        elif any(course[0] == 'PEND' for course in courses):
+            body = '<html>COURSE MATERIALS SELECTION PENDING</html>'
+        else:
+            body = '<html><form id="courseListForm">%s</form></html>' % ';'.join(
+                ' '.join(course) for course in courses)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class RenderingDriver:
+    'stands in for the browser when the bookstore sends javascript'
+    def execute_script(self, js):
+        self.page_source = '<html>rendered</html>'
+
+    def find_element_by_id(self, _):
+        pass
+
+
+def test_get_bookstore_http(monkeypatch):
+    assert download.bookstore_xml('201808', [('CSCE', 145, '001'), ('A&B', '1', '2')]) == (
+        '<textbookorder><courses><course dept="CSCE" num="145" sect="001" term="F18" />'
+        '<course dept="A&amp;B" num="1" sect="2" term="F18" /></courses></textbookorder>')
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Bookstore)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(download, 'BOOKSTORE_URL', 'http://127.0.0.1:%d/' % httpd.server_port)
+    try:
+        page = download.get_bookstore_http('201808', [('CSCE', '145', '001'),
+                                                      ('MATH', '141', '002')])
+        assert 'CSCE 145 001;MATH 141 002' in page
+        assert download.get_bookstore_http('201808', [('CHALLENGE', '1', '001')]) is None
+        with pytest.raises(ValueError):
+            download.get_bookstore_http('201808', [('PEND', '1', '001')])
+        # no browser unless the bookstore sends javascript
+        assert 'CSCE 145 001' in download.get_bookstore('201808', 'CSCE', '145', '001',
+                                                         driver=None)
+        assert download.get_bookstore('201808', 'CHALLENGE', '1', '001',
+                                      driver=RenderingDriver()) == '<html>rendered</html>'
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
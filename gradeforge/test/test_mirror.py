@@ -0,0 +1,74 @@
+'''Unit tests for gradeforge.mirror'''
+
+import gzip
+import os
+from time import monotonic
+
+from gradeforge.mirror import Job, Host, TokenBucket, download_all, jobs, verify
+
+PAGE = '<html><body>sections</body></html>\n'
+
+
+def test_download_all(tmpdir):
+    calls = []
+    def fetch(contents):
+        def inner():
+            calls.append(contents)
+            return contents
+        return inner
+
+    done, broken = str(tmpdir.join('done.html')), str(tmpdir.join('sub', 'broken.html'))
+    with open(done, 'w') as handle:
+        handle.write(PAGE)
+    all_jobs = [Job(done, 'host', fetch(PAGE)),
+                Job(str(tmpdir.join('new.html')), 'host', fetch(PAGE)),
+                # an error page where a spreadsheet should be
+                Job(str(tmpdir.join('grades.xlsx')), 'host', fetch('<html>404</html>')),
+                Job(broken, 'host', fetch('<html><body>cut off'))]
+    results = dict((job.path, result) for job, result in
+                   download_all(all_jobs, hosts={'host': Host(2, 1000, 10)}))
+    assert results[done] == 'skipped'
+    assert results[str(tmpdir.join('new.html'))] == 'downloaded'
+    assert isinstance(results[str(tmpdir.join('grades.xlsx'))], ValueError)
+    assert isinstance(results[broken], ValueError)
+    assert len(calls) == 3
+    # nothing half-written is left behind
+    assert sorted(os.listdir(str(tmpdir))) == ['done.html', 'new.html', 'sub']
+    assert os.listdir(str(tmpdir.join('sub'))) == []
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, burst=2)
+    start = monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # two for free, then four at 100 per second
+    assert monotonic() - start >= 0.035
+
+
+def test_jobs():
+    paths = [job.path for job in jobs(last='201408')]
+    assert paths[:3] == ['webpages/catalog.html', 'sections/Fall-2013.html',
+                         'sections/Spring-2014.html']
+    assert 'grades/Fall-2012-Upstate.pdf' in paths
+    assert 'grades/Fall-2013.xlsx' in paths and 'grades/Fall-2013-Aiken.pdf' not in paths
+    assert not [name for name in paths if name.startswith('exams/')]  # those start in 2016
+
+
+def test_download_compressed(tmpdir):
+    page, cut_off = str(tmpdir.join('page.html.gz')), str(tmpdir.join('cut.html.xz'))
+    all_jobs = [Job(page, 'host', lambda: PAGE), Job(cut_off, 'host', lambda: '<html><body>')]
+    results = dict((job.path, result) for job, result in
+                   download_all(all_jobs, hosts={'host': Host(2, 1000, 10)}))
+    assert results[page] == 'downloaded' and isinstance(results[cut_off], ValueError)
+    with gzip.open(page, 'rt') as readable:
+        assert readable.read() == PAGE
+    assert verify(page) and os.listdir(str(tmpdir)) == ['page.html.gz']
+    # a compressed file that was cut off isn't complete either
+    with open(page, 'rb') as readable, open(page + '.gz', 'wb') as writable:
+        writable.write(readable.read()[:-8])
+    assert not verify(page + '.gz', '.html')
+    # nor is one that isn't compressed the way its name says
+    os.rename(page, cut_off)
+    assert not verify(cut_off)
+    assert [job.path for job in jobs(('catalog',), compression='.xz')] == ['webpages/catalog.html.xz']
@@ -0,0 +1,107 @@
+'''Unit tests for gradeforge.parse'''
+
+import gzip
+import lzma
+from io import BytesIO, StringIO
+
+from gradeforge.combine import GRADE_HEADERS
+from gradeforge.parse import parse_grades, parse_sections, parse_many, output_paths
+from gradeforge.test.fixtures import grades_text, grades_xlsx, sections_html, XLSX_GRADE_HEADERS
+
+
+def sections_csv(html, **kwargs):
+    'Return the (sections, instructors, terms) csv files for `html` as strings'
+    outputs = StringIO(), StringIO(), StringIO()
+    parse_sections(BytesIO(html.encode()), instructor_output=outputs[1],
+                   term_output=outputs[2], section_output=outputs[0], **kwargs)
+    return tuple(output.getvalue() for output in outputs)
+
+
+def test_parse_sections():
+    sections, instructors, terms = sections_csv(sections_html(4))
+    sections = sections.splitlines()
+    assert len(sections) == 5
+    assert sections[1] == ('CSCE,100,000,10000,0,Columbia,Lecture,Traditional,MWF,'
+                           'SWGN 2A27,08:30,09:20,Instructor 0,,,')
+    assert instructors.splitlines()[1] == 'Instructor 0,mailto:instructor0@sc.edu'
+    assert terms.splitlines()[1:] == ['201808,2018-08-23,2018-12-1%d,2018-03-26,2018-08-29' % i
+                                      for i in range(3)]
+
+
+def test_parse_sections_stream():
+    html = sections_html(50)
+    assert sections_csv(html, stream=True) == sections_csv(html)
+
+
+def test_parse_sections_repairs():
+    html = sections_html(6)
+    quirks = html.replace('<td class="dddefault">\n<span', '<td class="dddefault">\n<b>Open<b>\n<span')
+    quirks = quirks.replace('3.000 Credits\n', '3.000 Credits <p>\n')
+    assert quirks.count('<b>Open<b>') == 6 and quirks.count(' <p>\n') == 6
+    for stream in False, True:
+        assert sections_csv(quirks, stream=stream) == sections_csv(html)
+
+
+def test_parse_compressed(tmpdir):
+    html = sections_html(5)
+    for extension, opener in ('.gz', gzip.open), ('.xz', lzma.open):
+        file_name = str(tmpdir.join('Fall-2018.html' + extension))
+        with opener(file_name, 'wt') as writable:
+            writable.write(html)
+        for stream in False, True:
+            outputs = StringIO(), StringIO(), StringIO()
+            parse_sections(file_name, instructor_output=outputs[1], term_output=outputs[2],
+                           section_output=outputs[0], stream=stream)
+            assert tuple(output.getvalue() for output in outputs) == sections_csv(html)
+
+
+def test_output_paths():
+    assert output_paths('exam', 'exams/Fall-2017.html') == {'output': 'exams/Fall-2017.csv'}
+    assert output_paths('exam', 'exams/Fall-2017.html.gz') == {'output': 'exams/Fall-2017.csv'}
+    assert output_paths('sections', 'sections/Fall-2017.html') == {
+        'section_output': 'sections/Fall-2017.csv',
+        'instructor_output': 'sections/Fall-2017.instructors.csv',
+        'term_output': 'sections/Fall-2017.terms.csv'}
+
+
+def test_parse_many(tmpdir):
+    html = sections_html(20)
+    inputs = [str(tmpdir.join('%s-2018.html' % season)) for season in ('Fall', 'Spring')]
+    for name in inputs:
+        with open(name, 'w') as handle:
+            handle.write(html)
+    assert sorted(name for name, _, _ in parse_many('sections', inputs, jobs=2)) == inputs
+    expected = sections_csv(html)
+    for name in inputs:
+        with open(name.replace('.html', '.terms.csv'), newline='') as handle:
+            assert handle.read() == expected[2]
+
+
+def test_parse_grades_xlsx(tmpdir):
+    file_name = str(tmpdir.join('Fall-2014.xlsx'))
+    grades_xlsx(file_name, 3)
+    output = StringIO()
+    parse_grades(file_name, output)
+    lines = output.getvalue().splitlines()
+    assert 'NoGrade' in XLSX_GRADE_HEADERS and 'No Grade' in lines[0].split(',')
+    assert lines[0].split(',') == GRADE_HEADERS
+    assert lines[2] == '201408,,CSCE,101,001,Course 1,' + '1,' * 8 + ',' * 15 + '8' + ',' * 5
+    assert len(lines) == 4
+
+
+def parse_grades_text(text, **kwargs):
+    'Return the csv parse_grades writes for the pdftotext output `text`'
+    output = StringIO()
+    parse_grades(StringIO(text), output, **kwargs)
+    return output.getvalue().replace('\r\n', '\n')
+
+
+def test_parse_grades_pages():
+    text = grades_text(230, per_page=20)
+    lines = parse_grades_text(text).splitlines()
+    assert lines[0] == ('SEMESTER,CAMPUS,DEPARTMENT,CODE,SECTION,A,B+,B,C+,C,D+,D,F,S,U,W,WF,'
+                        'INCOMPLETE,NR,AUDIT,TOTAL')
+    assert len(lines) == 231
+    assert lines[1].startswith('201241,') and lines[-1].split(',')[3:5] == ['329', '019']
+    for pages in 1, 3:
+        assert parse_grades_text(text, pages=pages) == '\n'.join(lines) + '\n'
@@ -0,0 +1,82 @@
+'''Unit tests for gradeforge.replay'''
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from time import monotonic
+
+import pytest
+import requests
+
+from gradeforge import download, replay, session
+from gradeforge.test.fixtures import sections_html
+
+
+class Server(BaseHTTPRequestHandler):
+    'answers every request with the method, path and body it was sent'
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = ('%s %s %s' % (self.command, self.path, self.rfile.read(length).decode())).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+def test_record_replay(tmpdir):
+    directory = str(tmpdir.join('recordings'))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Server)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d/exams' % httpd.server_port
+    try:
+        recorder = session.make_session()
+        replay.record(directory, recorder)
+        assert recorder.get(url).text == 'GET /exams '
+        assert recorder.post(url, data={'term_in': '201808'}).text == 'POST /exams term_in=201808'
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    # the server is gone, so these can only come from the recordings
+    player = session.make_session()
+    replay.replay(directory, latency=0.05, session=player)
+    response = player.post(url, data={'term_in': '201808'})
+    assert response.status_code == 200 and response.encoding == 'utf-8'
+    assert response.text == 'POST /exams term_in=201808'
+    assert b''.join(player.get(url, stream=True).iter_content(4)) == b'GET /exams '
+    with pytest.raises(requests.ConnectionError):
+        player.post(url, data={'term_in': '201801'})
+
+    # latency is per request, not per adapter, so concurrent requests overlap
+    start = monotonic()
+    threads = [threading.Thread(target=player.get, args=(url,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert monotonic() - start < 8 * 0.05
+
+
+def test_replay_download(tmpdir, monkeypatch):
+    'download functions use the shared session, so they can be replayed too'
+    directory = str(tmpdir)
+    page = sections_html(3)
+    request = requests.Request('POST', download.SECTIONS_URL,
+                               data=download.sections_form(semester='201808')).prepare()
+    response = requests.Response()
+    response.status_code, response.reason, response._content = 200, 'OK', page.encode()
+    replay.save(directory, request, response)
+
+    monkeypatch.setattr(session, '_SESSION', session.make_session())
+    replay.replay(directory)
+    output = BytesIO()
+    download.get_sections(output, semester='201808')
+    assert output.getvalue() == page.encode()
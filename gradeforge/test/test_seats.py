@@ -0,0 +1,44 @@
+'''Unit tests for gradeforge.seats'''
+
+import sqlite3
+import threading
+
+from gradeforge import pipeline
+from gradeforge.seats import refresh_seats
+from gradeforge.test.fixtures import sections_html
+
+
+def test_refresh_seats(tmpdir):
+    sections, database = str(tmpdir.join('Fall-2018.html')), str(tmpdir.join('classes.sql'))
+    with open(sections, 'w') as handle:
+        handle.write(sections_html(10))
+    pipeline.build(database, sections=[sections])
+
+    fetched, lock = [], threading.Lock()
+    def fetch(link):
+        uid = int(link.split('crn_in=')[1])
+        with lock:
+            fetched.append(uid)
+        if uid == 10003:
+            raise ValueError('no such section')
+        return ('30', ' %d' % (uid - 10000), str(30 - (uid - 10000)))
+
+    results = refresh_seats('201808', database=database, rate=1000, fetch=fetch)
+    assert results == {'refreshed': 9, 'failed': 1, 'fresh': 0}
+    assert sorted(fetched) == list(range(10000, 10010))
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT capacity, taken, remaining FROM seats '
+                                  'WHERE uid = 10002').fetchall() == [(30, 2, 28)]
+
+    # everything but the failure is fresh
+    del fetched[:]
+    results = refresh_seats('201808', database=database, rate=1000, fetch=fetch)
+    assert results == {'fresh': 9, 'failed': 1}
+    assert fetched == [10003]
+
+    # a TTL of 0 refreshes everything, and only the uids asked for
+    del fetched[:]
+    results = refresh_seats('201808', [10001, 10002], database, ttl=0, rate=1000, fetch=fetch)
+    assert results == {'refreshed': 2, 'fresh': 0}
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM seats').fetchone() == (9,)
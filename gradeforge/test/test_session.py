@@ -0,0 +1,45 @@
+'''Unit tests for gradeforge.session'''
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gradeforge.session import make_session
+
+
+class Flaky(BaseHTTPRequestHandler):
+    'fails the first two requests with a 503, then succeeds'
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    requests = 0
+
+    def do_GET(self):
+        Flaky.requests += 1
+        status, body = (503, b'try again') if Flaky.requests <= 2 else (200, b'ok')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Flaky)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/' % httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_retries(server):
+    Flaky.requests = 0
+    session = make_session(backoff=0)
+    assert session.get(server, timeout=5).text == 'ok'
+    assert Flaky.requests == 3
+    Flaky.requests = 0
+    # out of retries: the last response is returned rather than raising
+    assert make_session(retries=1, backoff=0).get(server, timeout=5).status_code == 503
@@ -0,0 +1,206 @@
+'''Unit tests for gradeforge.sql and gradeforge.pipeline'''
+
+import os
+import sqlite3
+import threading
+from io import BytesIO
+
+import pytest
+
+from gradeforge import pipeline, sql
+from gradeforge.parse import parse_sections
+from gradeforge.test.fixtures import sections_html, catalog_html, grades_xlsx
+
+
+@pytest.fixture
+def semesters(tmpdir):
+    'sections pages for two semesters, with 3 and 2 distinct terms'
+    files = []
+    for season, count, terms in ('Fall', 30, 3), ('Spring', 20, 2):
+        name = str(tmpdir.join('%s-2018.html' % season))
+        with open(name, 'w') as handle:
+            handle.write(sections_html(count, season=season, terms=terms))
+        files.append(name)
+    return files
+
+
+def test_build(tmpdir, semesters):
+    database = str(tmpdir.join('classes.sql'))
+    pipeline.build(database, sections=semesters)
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM term').fetchone() == (5,)
+        # term ids were assigned across both files, so each section still finds its semester
+        by_semester = connection.execute('''SELECT semester, COUNT(*)
+                                            FROM section INNER JOIN term ON term = term.id
+                                            GROUP BY semester''').fetchall()
+        assert by_semester == [('201801', 20), ('201808', 30)]
+        assert connection.execute('SELECT COUNT(*) FROM instructor').fetchone() == (30,)
+        assert connection.execute("SELECT startTime, primary_instructor FROM section "
+                                  "WHERE uid = 10001").fetchall() == [('10:50', 'Instructor 1')] * 2
+
+
+def test_create_bulk(tmpdir):
+    files = {name: str(tmpdir.join(name + '.csv')) for name in
+             ('catalog', 'departments', 'instructors', 'terms', 'sections', 'grades', 'exams')}
+    for name, header in (('catalog', 'title'), ('departments', 'code'), ('grades', 'semester'),
+                         ('exams', 'semester')):
+        with open(files[name], 'w') as handle:
+            handle.write(header + '\n')
+    with open(files['sections'], 'w') as sections, open(files['instructors'], 'w') as instructors:
+        parse_sections(BytesIO(sections_html(10).encode()), instructors, files['terms'], sections)
+    with open(files['terms']) as terms:
+        lines = terms.read().splitlines()
+    with open(files['terms'], 'w') as terms:
+        terms.write('id,%s\n' % lines[0])
+        terms.writelines('%d,%s\n' % pair for pair in enumerate(lines[1:]))
+
+    contents = []
+    for bulk in False, True:
+        database = str(tmpdir.join('bulk.sql' if bulk else 'default.sql'))
+        timings = sql.create(database=database, bulk=bulk, **files)
+        assert list(timings) == ['class', 'department', 'instructor', 'term', 'section',
+                                 'grade', 'exam', 'indexes', 'total']
+        with sqlite3.connect(database) as connection:
+            # the pragmas only last while loading
+            assert connection.execute('PRAGMA journal_mode').fetchone() == ('delete',)
+            contents.append([connection.execute('SELECT * FROM %s ORDER BY 1, 2' % table)
+                             .fetchall() for table in ('section', 'instructor', 'term')])
+    assert contents[0] == contents[1]
+    assert len(contents[0][0]) == 10
+
+
+@pytest.mark.parametrize('fail', (False, True))
+def test_bulk_load_restores_pragmas(tmpdir, fail):
+    connection = sqlite3.connect(str(tmpdir.join('wal.sql')))
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute('PRAGMA cache_size = -4096')
+    connection.execute('CREATE TABLE numbers(n)')
+    try:
+        with sql.bulk_load(connection):
+            assert connection.execute('PRAGMA synchronous').fetchone() == (0,)
+            connection.execute('INSERT INTO numbers VALUES (1)')
+            if fail:
+                raise ValueError
+    except ValueError:
+        pass
+    assert connection.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    assert connection.execute('PRAGMA synchronous').fetchone() == (1,)
+    assert connection.execute('PRAGMA cache_size').fetchone() == (-4096,)
+    assert connection.execute('SELECT n FROM numbers').fetchall() == ([] if fail else [(1,)])
+    connection.close()
+
+
+def test_explain(tmpdir, semesters):
+    database = str(tmpdir.join('classes.sql'))
+    pipeline.build(database, sections=semesters)
+    plans = sql.explain(database)
+    assert sorted(plans) == sorted(sql.QUERIES)
+    for plan in plans.values():
+        # the big tables are always searched through an index, never scanned
+        assert not [step for step in plan if step.startswith(('SCAN section', 'SCAN grade'))]
+    assert 'grade_course' in plans['section_grades'][0]
+
+
+def test_update(tmpdir, semesters):
+    database = str(tmpdir.join('classes.sql'))
+    pipeline.build(database, sections=semesters)
+    fall, spring = semesters
+    with open(fall, 'w') as handle:
+        handle.write(sections_html(10, season='Fall', terms=1))
+
+    changes = pipeline.update('201808', database, sections=[fall], exams=[], grades=[])
+    assert changes == {'section': (30, 10), 'term': (3, 1)}
+    with sqlite3.connect(database) as connection:
+        by_semester = connection.execute('''SELECT semester, COUNT(*)
+                                            FROM section INNER JOIN term ON term = term.id
+                                            GROUP BY semester''').fetchall()
+        assert by_semester == [('201801', 20), ('201808', 10)]
+        assert connection.execute('SELECT COUNT(*) FROM term').fetchone() == (3,)
+
+    # catalogs replace every class, and only add departments
+    catalogs = []
+    for department, count in ('CSCE', 5), ('MATH', 3):
+        catalogs.append(str(tmpdir.join('%s.html' % department)))
+        with open(catalogs[-1], 'w') as handle:
+            handle.write(catalog_html(count, department, department.title()))
+    for classes, departments in ((0, 8), (0, 2)), ((8, 8), (0, 0)):
+        changes = pipeline.update('201808', database, sections=[], exams=[], grades=[],
+                                  catalogs=catalogs)
+        assert changes == {'class': classes, 'department': departments}
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM class').fetchone() == (8,)
+        assert connection.execute('SELECT * FROM department ORDER BY code').fetchall() == [
+            ('CSCE', 'Csce'), ('MATH', 'Math')]
+
+    # the wrong semester's file is rejected without deleting anything
+    with pytest.raises(ValueError):
+        pipeline.update('201808', database, sections=[spring], exams=[], grades=[])
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM section').fetchone() == (30,)
+
+
+def test_update_grades(tmpdir, semesters):
+    database = str(tmpdir.join('classes.sql'))
+    pipeline.build(database, sections=semesters)
+    grades_dir = tmpdir.mkdir('grades')
+    grades_xlsx(str(grades_dir.join('Fall-2018.xlsx')), 7)
+    # a CSV left over from xlsx2csv isn't loaded as well
+    grades_dir.join('Fall-2018.csv').write('SEMESTER,CAMPUS,DEPARTMENT\n201808,,CSCE\n')
+    defaults = pipeline.semester_files('201808', grades_dir=str(grades_dir))
+    assert defaults['grades'] == [str(grades_dir.join('Fall-2018.xlsx'))]
+
+    changes = pipeline.update('201808', database, sections=[], exams=[],
+                              grades=defaults['grades'])
+    assert changes == {'grade': (0, 7)}
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM grade WHERE semester = '201808'"
+                                  ).fetchone() == (7,)
+
+
+def test_connection_pool(tmpdir, semesters):
+    database = str(tmpdir.join('classes.sql'))
+    pipeline.build(database, sections=semesters[:1])
+    pool = sql.ConnectionPool()
+    connection = pool.get(database)
+    assert pool.get(database) is connection
+    with pytest.raises(sqlite3.OperationalError):
+        connection.execute('DELETE FROM section')
+
+    # another thread gets its own connection, which is reused after that thread exits
+    others = []
+    for _ in range(2):
+        thread = threading.Thread(target=lambda: others.append(pool.get(database)))
+        thread.start()
+        thread.join()
+    assert others[0] is others[1] is not connection
+
+    # replacing the file gets a new connection that sees the new contents
+    os.unlink(database)
+    pipeline.build(database, sections=semesters)
+    assert pool.get(database) is not connection
+    assert pool.get(database).execute('SELECT COUNT(*) FROM section').fetchone() == (50,)
+    pool.close()
+
+
+def test_immutable_pool(tmpdir, semesters):
+    database = str(tmpdir.join('classes.sql'))
+    pipeline.build(database, sections=semesters)
+    pool = sql.ConnectionPool(immutable=True)
+    connection = pool.get(database)
+    assert connection.execute('PRAGMA mmap_size').fetchone()[0] > 0
+    assert connection.execute('SELECT COUNT(*) FROM section').fetchone() == (50,)
+    # sqlite won't notice changes to an immutable database, so the pool has to
+    os.utime(database, ns=(0, 0))
+    assert pool.get(database) is not connection
+    pool.close()
+
+
+@pytest.mark.parametrize('bulk', (False, True))
+def test_build_failure(tmpdir, semesters, bulk):
+    database = str(tmpdir.join('classes.sql'))
+    with pytest.raises(OSError):
+        pipeline.build(database, sections=semesters + [str(tmpdir.join('missing.html'))],
+                       bulk=bulk)
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM section').fetchone() == (0,)
@@ -1,10 +1,13 @@
 '''Unit tests for gradeforge.utils'''
 
+import os
 from datetime import date
+from os import path
 
 import pytest
 
-from gradeforge.utils import parse_semester, army_time, get_season, b_and_n_semester
+from gradeforge.utils import (parse_semester, army_time, iso_date, get_season, b_and_n_semester,
+                              atomic_output, open_compressed, uncompressed_name)
 
 def test_parse_semester():
     assert parse_semester('fall') == str(date.today().year) + '08'
@@ -28,12 +31,22 @@ def test_army_time():
     assert army_time('00:00') == '00:00'
     assert army_time('00:00\x01') == '00:00'
     assert army_time('10:00 a.\x01m.') == '10:00'
+    hits = army_time.cache_info().hits
+    assert army_time('1:00 pm') == '13:00'
+    assert army_time.cache_info().hits == hits + 1
+
+
+def test_iso_date():
+    assert iso_date('Aug 24, 2018') == '2018-08-24'
+    assert iso_date('Jan 2 2019') == '2019-01-02'
 
 
 def test_get_season():
     assert get_season('201808') == 'Fall'
     assert get_season('201405') == 'Summer'
     assert get_season('201901') == 'Spring'
+    assert get_season('201341') == 'Fall'
+    assert get_season('201211') == 'Spring'
     with pytest.raises(ValueError):
         get_season('-2')
     with pytest.raises(ValueError):
@@ -55,3 +68,24 @@ def test_b_and_n_semester():
         b_and_n_semester('some garbage')
     with pytest.raises(ValueError):
         b_and_n_semester('-21505')
+
+
+def test_atomic_output(tmpdir):
+    file_name = str(tmpdir.join('pages', 'Fall-2018.html.xz'))
+    with atomic_output(file_name) as writable:
+        writable.write(b'<html></html>')
+        assert not path.exists(file_name)
+    with open(file_name, 'rb') as readable:
+        assert readable.read(6) == b'\xfd7zXZ\x00'  # xz magic
+    with open_compressed(file_name) as readable:
+        assert readable.read() == '<html></html>'
+    assert uncompressed_name(file_name) == str(tmpdir.join('pages', 'Fall-2018.html'))
+
+    with pytest.raises(KeyboardInterrupt):
+        with atomic_output(file_name) as writable:
+            writable.write(b'half a page')
+            raise KeyboardInterrupt
+    # the old file is untouched and the temporary file is gone
+    assert os.listdir(str(tmpdir.join('pages'))) == ['Fall-2018.html.xz']
+    with open_compressed(file_name) as readable:
+        assert readable.read() == '<html></html>'
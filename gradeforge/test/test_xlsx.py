@@ -0,0 +1,15 @@
+'''Unit tests for gradeforge.xlsx'''
+
+from gradeforge.test.fixtures import write_xlsx
+from gradeforge.xlsx import iter_rows
+
+
+def test_iter_rows(tmpdir):
+    file_name = str(tmpdir.join('book.xlsx'))
+    rows = [['name', 'count', 'ratio'], ['a & b', 12, 1.5], [None, None, 'x'],
+            ['wide'] + [None] * 26 + [3]]
+    write_xlsx(file_name, rows)
+    assert list(iter_rows(file_name)) == [['name', 'count', 'ratio'], ['a & b', '12', '1.5'],
+                                          ['', '', 'x'], ['wide'] + [''] * 26 + ['3']]
+    with open(file_name, 'rb') as readable:
+        assert len(list(iter_rows(readable))) == 4
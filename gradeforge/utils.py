@@ -2,15 +2,23 @@
 
 '''Misc utils. Strictly functional, not state-based.'''
 
+import gzip
+import lzma
+import os
 import re
-from os import path
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from os import path, environ
 from argparse import HelpFormatter
-from datetime import date
+from datetime import date, datetime
 from sys import stdout
 
 from dateutil.parser import parse as time_parse
 
 DEFAULT_DATABASE = path.join(path.dirname(path.abspath(__file__)), 'classes.sql')
+DEFAULT_CACHE = path.join(environ.get('XDG_CACHE_HOME', path.expanduser(path.join('~', '.cache'))),
+                          'gradeforge')
 
 # first semester is not a typo, this is how it is really accepted on the USC side
 allowed = {'semester': ("201341", "201401", "201405", "201408", "201501", "201505",
@@ -85,9 +93,10 @@ def get_season(semester='201808'):
     semester = str(semester)
     if not (len(semester) == 6 and semester.isnumeric()):
         raise ValueError("Expected 6 digit semester; got " + semester)
-    if semester[-2:] == '08':
+    # before 2014, fall was 41 and spring was 11
+    if semester[-2:] in ('08', '41'):
         return 'Fall'
-    elif semester[-2:] == '01':
+    elif semester[-2:] in ('01', '11'):
         return 'Spring'
     elif semester[-2:] == '05':
         return 'Summer'
@@ -136,10 +145,83 @@ def get_semester_today():
     return parse_semester(get_season_today())
 
 
+def parse_size(size):
+    '''Example: '500M' -> 524288000. Suffixes are powers of 1024; no suffix means bytes'''
+    size = str(size).strip().upper().rstrip('B')
+    for power, suffix in enumerate('KMGT', 1):
+        if size.endswith(suffix):
+            return int(float(size[:-1]) * 1024 ** power)
+    return int(size)
+
+
+# extension: function that opens files compressed that way, the same as `open`
+COMPRESSION = {'.gz': gzip.open, '.xz': lzma.open}
+
+
+def uncompressed_name(file_name):
+    '''Example: sections/Fall-2018.html.gz -> sections/Fall-2018.html'''
+    base, ext = path.splitext(file_name)
+    return base if ext in COMPRESSION else file_name
+
+
+def open_compressed(file_name, mode='r'):
+    '''Same as `open`, but files ending in .gz or .xz are (de)compressed transparently'''
+    opener = COMPRESSION.get(path.splitext(file_name)[1], open)
+    if opener is not open and 'b' not in mode:
+        mode += 't'  # gzip and lzma default to binary
+    return opener(file_name, mode)
+
+
+@contextmanager
+def open_input(file_handle, mode='rb'):
+    '''If `file_handle` is a file name, open it with open_compressed and close it afterwards.
+    Otherwise it's already open, so use it as-is'''
+    if hasattr(file_handle, 'read'):
+        yield file_handle
+    else:
+        with open_compressed(file_handle, mode) as readable:
+            yield readable
+
+
+@contextmanager
+def atomic_output(file_name, check=None):
+    '''Open `file_name` for writing bytes, compressed if it ends in .gz or .xz.
+    The bytes go to a temporary file which is renamed to `file_name` once the
+    block finishes, so `file_name` is never left half-written.
+    check: called with the path of the finished temporary file and `file_name`;
+           if it returns False, ValueError is raised and `file_name` is left alone'''
+    directory = path.dirname(file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # keep the extension so open_compressed knows how to compress it.
+    # threads in one process (see mirror and books) each get their own name too
+    base, ext = path.splitext(file_name)
+    tmp = '%s.%d.%d.tmp%s' % (base, os.getpid(), threading.get_ident(), ext)
+    try:
+        with open_compressed(tmp, 'wb') as writable:
+            yield writable
+        if check is not None and not check(tmp, file_name):
+            raise ValueError("%s doesn't look like a complete file" % file_name)
+        os.replace(tmp, file_name)
+    except BaseException:
+        if path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# pages spell the same few dozen times and dates over and over,
+# so parsing each one once is enough
+@lru_cache(maxsize=1024)
 def army_time(given_time):
     return time_parse(given_time.replace('\x01', '')).strftime("%H:%M")
 
 
+@lru_cache(maxsize=1024)
+def iso_date(given_date):
+    '''Example: 'Aug 24, 2018' -> '2018-08-24' '''
+    return datetime.strptime(given_date.replace(',', ''), "%b %d %Y").date().isoformat()
+
+
 def catalog_link(semester, department, code):
     '''Example:
     https://ssb.onecarolina.sc.edu/BANP/bwckctlg.p_disp_course_detail?cat_term_in=201808&subj_code_in=BADM&crse_numb_in=B210
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import flask
 from ..sql import query
+from ..utils import DEFAULT_DATABASE
 
 app = flask.Flask(__name__, template_folder='.', static_url_path='/')
+app.config.setdefault('DATABASE', DEFAULT_DATABASE)
+# set by `gradeforge web --immutable`; see sql.ConnectionPool
+app.config.setdefault('IMMUTABLE', False)
 
 @app.route('/', methods=['GET'])
 @app.route('/index.html', methods=['GET'])
@@ -23,7 +27,9 @@ def submit():
 @app.route('/api', methods=['GET', 'POST'])
 def sections():
     params = (flask.request.args if flask.request.method == 'GET' else flask.request.form)
-    response = flask.make_response(query(**params))  # TODO
+    # queries are read-only and run on a connection shared with earlier requests
+    response = flask.make_response(query(params['sql_query'], app.config['DATABASE'],
+                                         immutable=app.config['IMMUTABLE']))  # TODO
     # don't cache anything: https://stackoverflow.com/a/2068407
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
@@ -0,0 +1,106 @@
+'''Read the rows of an xlsx workbook without converting it to csv first.
+
+An xlsx file is a zip of XML files: the cells of each sheet are in
+xl/worksheets/, and most text is stored once in xl/sharedStrings.xml
+and referred to by index. Only the sheet is streamed; the shared strings
+have to be read first, but grade spreads repeat so much text that there are few.'''
+
+import re
+import zipfile
+from posixpath import join, normpath
+
+from lxml import etree
+
+MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+PACKAGE = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def _text(element):
+    '''INTERNAL DO NOT USE
+    the text of a shared or inline string, without phonetic hints (<rPh>)'''
+    return ''.join(element.xpath('x:t/text() | x:r/x:t/text()', namespaces={'x': MAIN[1:-1]}))
+
+
+def shared_strings(archive):
+    '''Return the list of shared strings in the open zipfile `archive`'''
+    try:
+        readable = archive.open('xl/sharedStrings.xml')
+    except KeyError:  # every cell is a number or an inline string
+        return []
+    strings = []
+    with readable:
+        for _, element in etree.iterparse(readable, tag=MAIN + 'si'):
+            strings.append(_text(element))
+            element.clear()
+    return strings
+
+
+def first_sheet(archive):
+    '''Return the name in `archive` of the first sheet in the workbook'''
+    with archive.open('xl/workbook.xml') as readable:
+        sheet = etree.parse(readable).find('%ssheets/%ssheet' % (MAIN, MAIN))
+    with archive.open('xl/_rels/workbook.xml.rels') as readable:
+        for relationship in etree.parse(readable).iter(PACKAGE + 'Relationship'):
+            if relationship.get('Id') == sheet.get(RELATIONSHIP):
+                target = relationship.get('Target')
+                # targets are relative to xl/, unless they start with a slash
+                if target.startswith('/'):
+                    return target.lstrip('/')
+                return normpath(join('xl', target))
+    raise ValueError("workbook has no sheets")
+
+
+def _number(value):
+    '''INTERNAL DO NOT USE
+    counts are stored as floats; write 12 rather than 12.0, like xlsx2csv'''
+    number = float(value)
+    return str(int(number)) if number.is_integer() else value
+
+
+def _column(reference):
+    '''INTERNAL DO NOT USE
+    Example: 'AB12' -> 27'''
+    index = 0
+    for letter in re.match('[A-Z]+', reference).group():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _value(cell, strings):
+    '''INTERNAL DO NOT USE'''
+    kind, value = cell.get('t'), cell.findtext(MAIN + 'v')
+    if kind == 'inlineStr':
+        inline = cell.find(MAIN + 'is')
+        return '' if inline is None else _text(inline)
+    if value is None:
+        return ''
+    if kind == 's':
+        return strings[int(value)]
+    if kind == 'b':
+        return 'TRUE' if value == '1' else 'FALSE'
+    if kind in ('str', 'e'):  # formula results and errors
+        return value
+    return _number(value)
+
+
+def iter_rows(file_handle):
+    '''Yield every row of the first sheet in the workbook `file_handle`
+    (a path or an open binary file) as a list of strings.
+    Empty cells are '', so every value is in the column it was in the spreadsheet.
+    Rows are read lazily, so an open file has to stay open until they are used up.'''
+    with zipfile.ZipFile(file_handle) as archive:
+        strings = shared_strings(archive)
+        with archive.open(first_sheet(archive)) as readable:
+            for _, row in etree.iterparse(readable, tag=MAIN + 'row'):
+                values = []
+                for cell in row.iterchildren(MAIN + 'c'):
+                    reference = cell.get('r')
+                    if reference is not None:
+                        values.extend([''] * (_column(reference) - len(values)))
+                    values.append(_value(cell, strings))
+                row.clear()
+                # the cleared rows are still children of <sheetData>
+                while row.getprevious() is not None:
+                    del row.getparent()[0]
+                yield values